@@ -0,0 +1,74 @@
+# coding=utf-8
+import asyncio
+import json
+from data_engine import make_engine
+from parallel_generation import derive_seeds, resolve_seed, split_companies
+from pipeline import AsyncGenerationPipeline, company_chunks
+from queries import BASELINE, query_spec
+
+# Load configuration
+with open('config.json', 'r') as config_file:
+    config = json.load(config_file)
+
+class AsyncModel:
+
+    """Asyncio implementation of the model interface on top of any of the model classes, with the PyMongo async API
+    (AsyncMongoClient). The data is written by an AsyncGenerationPipeline, which generates the next chunk while the
+    previous batches are in flight, and the query objects of the model run with execute_async(), so independent
+    queries can be outstanding at the same time on one client"""
+
+    def __init__(self, model_class, client, db):
+        self.model = model_class(client=client, db=db)  # Transforms and query objects of the model, on async collections
+        self.client = client
+        self.db = db
+
+    async def data_generator(self, n, seed=None, dataset=None):
+
+        """Generate n documents (companies and people) in this process: the same data as the synchronous
+        data_generator(n, workers=1, seed=seed). If a canonical `dataset` is given, its data is written instead"""
+
+        seed = resolve_seed(seed)
+
+        # 1. Collection Setup (the collections are created by their first insert)
+
+        # Drop existing collections except system collections
+        for collection_name in await self.db.list_collection_names():
+            if not collection_name.startswith('system.'):
+                await self.db.drop_collection(collection_name)  # Drop existing collections except system collections
+                print(f"Dropped collection: {collection_name}")
+
+        # 2. Data Generation
+
+        pipeline = AsyncGenerationPipeline.from_pipeline(self.db, self.model._pipeline())
+        if dataset is not None:
+            # Project the canonical dataset into the documents of the model (only the writes are left to do)
+            written = await pipeline.run(dataset.chunks())
+        else:
+            person_company_ratio = config['generation']['person_company_ratio']  # Ratio of people to companies (with a default value)
+            n_companies = n // person_company_ratio  # Number of companies to generate
+            n_people = n - n_companies  # Number of people to generate
+
+            # A single shard with the seed of the first worker, as a one-worker synchronous run
+            [(n_companies, n_people, sizes)] = split_companies(n_companies, n_people, 1, seed)
+            engine = make_engine(seed=derive_seeds(seed, 1)[0])
+            written = await pipeline.run(company_chunks(engine, n_companies, n_people, sizes=sizes))
+
+        print(f"Wrote {', '.join(f'{count} items to {name}' for name, count in written.items())} with asyncio.")
+        print("Data generation completed successfully.")
+        return written
+
+    async def run_query(self, query, variant=BASELINE):
+        """Execute one query (query_spec of the model) and return its results"""
+        return await query_spec(self.model, query, variant).execute_async()
+
+    async def run_queries(self, queries):
+
+        """Execute read queries concurrently; returns their results in the order of `queries`. Updates are not
+        independent of the reads (Query 4 renames the companies whose names Query 1 projects), so running them in the
+        same gather would interleave them nondeterministically: they must be run one after the other with run_query"""
+
+        specs = [query_spec(self.model, query) for query in queries]
+        updates = [query for query, spec in zip(queries, specs) if spec.kind != 'read']
+        if updates:
+            raise ValueError(f"Updates cannot run concurrently with other queries (queries {', '.join(str(query) for query in updates)})")
+        return await asyncio.gather(*(spec.execute_async() for spec in specs))
@@ -0,0 +1,511 @@
+# coding=utf-8
+from model1 import Model1
+from model2 import Model2
+from model3 import Model3
+from model4 import Model4
+from model3_buckets import Model3Buckets
+from async_models import AsyncModel
+from connection import available_compressors, connect, connection_settings
+from data_loading import canonical_dataset, load_data
+from dataset_cache import DatasetCache
+from parallel_generation import resolve_seed
+from generation_benchmark import fit_growth_exponent
+from indexes import NO_INDEXES, apply_index_profile
+from materialized_views import MaterializedViews, RefreshedUpdate
+from snapshots import Snapshot
+from queries import BASELINE, AggregateQuery, PartitionedQuery, execution_stats, query_spec, query_variants, same_results
+import argparse
+import asyncio
+import contextlib
+import csv
+import datetime
+import io
+import json
+import subprocess
+import time
+import numpy as np
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Load configuration file
+with open('config.json', 'r') as config_file:
+    config = json.load(config_file)
+
+MODELS = {1: Model1, 2: Model2, 3: Model3, 4: Model4, 5: Model3Buckets}
+QUERIES = [1, 2, 3, 4]
+STATISTICS = ["min", "median", "mean", "p95", "p99", "stddev"]
+BREAKDOWN = ["server_time_ms", "client_time_ms", "docs_examined", "keys_examined"]  # From the explain of every query
+SERIES = ["query", "variant", "index_profile", "partitions"]  # Results of different series are never compared with each other
+
+def summarize(times_ns):
+
+    """Statistics (in milliseconds) of the timings of one query"""
+
+    times_ms = np.array(times_ns) / 1e6
+    return {
+        "min": float(times_ms.min()),
+        "median": float(np.median(times_ms)),
+        "mean": float(times_ms.mean()),
+        "p95": float(np.percentile(times_ms, 95)),
+        "p99": float(np.percentile(times_ms, 99)),
+        "stddev": float(times_ms.std(ddof=1)) if len(times_ms) > 1 else 0.0
+    }
+
+def time_query(spec, repetitions, warmup, stream=None, reset=None):
+
+    """Run a query warmup times without timing it, then repetitions times; returns the timings in nanoseconds.
+
+    With stream options, read queries consume their cursor with AggregateQuery.stream() instead of building the list
+    of results, and the times to the first row and the number of rows are returned too. With a `reset` function
+    (e.g. Snapshot.restore), it is called before every execution of an update, outside of the timings"""
+
+    streamed = stream is not None and spec.kind == 'read'
+    run = (lambda: spec.stream(**stream)) if streamed else spec.execute
+    reset = reset if spec.kind == 'write' else None
+    for _ in range(warmup):
+        if reset:
+            reset()
+        run()  # Fills the caches of the server (and the connection pool) before measuring
+    times_ns, first_row_ns, rows = [], [], None
+    for _ in range(repetitions):
+        if reset:
+            reset()  # Every execution updates the same documents
+        start_time = time.perf_counter_ns()
+        result = run()  # Results are fetched completely, as in query_k()
+        times_ns.append(time.perf_counter_ns() - start_time)
+        if streamed:
+            first_row_ns.append(result.first_row_ns or 0)
+            rows = result.rows
+    return times_ns, (first_row_ns if streamed else None), rows
+
+def benchmark_query(spec, labels, args, stream, reset=None):
+
+    """Time a query, explain it and print its statistics; returns its result row (labels, statistics and timings)"""
+
+    # Queries 3 and 4 are updates: without a reset, every execution runs on the data left by the previous ones
+    times_ns, first_row_ns, rows = time_query(spec, args.repetitions, args.warmup, stream, reset)
+    statistics = summarize(times_ns)
+    result = {
+        **labels,
+        "kind": spec.kind,
+        **statistics,
+        "explain": None if args.no_explain else time_breakdown(spec, statistics["median"]),
+        "rows": rows,
+        "first_row": summarize(first_row_ns) if first_row_ns else None,  # Time to the first row
+        "speedup": None,  # Partitioned queries: median time of the unpartitioned query / median time
+        "times_ns": times_ns,  # Full drain times when streaming
+        "first_row_ns": first_row_ns
+    }
+    print(f"{query_label(result):<16}" + "".join(f"{statistics[name]:>10.2f}" for name in STATISTICS))
+    if first_row_ns:
+        print(f"{'  first row':<16}" + "".join(f"{result['first_row'][name]:>10.2f}" for name in STATISTICS) + f"  ({rows} rows)")
+    return result
+
+def query_label(result):
+    label = f"Q{result['query']} {result['variant']}"
+    return label if result["partitions"] == 1 else f"{label} x{result['partitions']}"
+
+def time_breakdown(spec, median_ms):
+
+    """Explain a query and split its median time into server execution and client time (network transfer and BSON
+    decoding of the results, plus driver overhead). The server time comes from a separate, explained execution"""
+
+    stats = execution_stats(spec.explain())
+    return {
+        **stats,
+        "client_time_ms": max(median_ms - stats["server_time_ms"], 0.0)
+    }
+
+def checked_variants(model, queries):
+
+    """Variants of every query to time: the baseline and the variants that give the same results as the baseline.
+    The check runs on the freshly loaded data and does not modify it (updates are checked on a scratch copy)"""
+
+    variants = {}
+    for query in queries:
+        baseline = query_spec(model, query)
+        variants[query] = [BASELINE]
+        for variant in query_variants(model, query)[1:]:
+            if same_results(baseline, query_spec(model, query, variant)):
+                variants[query].append(variant)
+            else:
+                print(f"Variant '{variant}' of query {query} gives different results than the baseline, it is not timed.")
+    return variants
+
+def build_views(model):
+
+    """Build the materialized views of a model and check that they hold the results of their queries"""
+
+    views = MaterializedViews(model)
+    for name, build_time in views.build().items():
+        print(f"Built the materialized view {name} in {build_time:.3f} seconds.")
+    for query in sorted({view["query"] for view in views.views.values()}):
+        if not same_results(query_spec(model, query), views.query(query)):
+            print(f"Warning: the view of query {query} does not give the same results as the query.")
+    return views
+
+def print_view_costs(results):
+
+    """Read time gained by the views and write time paid to refresh them (difference of the median times)"""
+
+    baselines = {result["query"]: result for result in results if result["variant"] == BASELINE and result["partitions"] == 1}
+    for result in results:
+        if result["variant"] in ("view", "refresh") and result["query"] in baselines:
+            difference = result["median"] - baselines[result["query"]]["median"]
+            if result["variant"] == "view":
+                print(f"Q{result['query']} read from the view: {-difference:.2f} ms faster than the query")
+            else:
+                print(f"Q{result['query']} update with refresh of the views: {difference:.2f} ms slower than the update alone")
+
+def company_size_histogram(model):
+
+    """Number of companies by number of employees, in power-of-2 bins (0, 1, 2-3, 4-7, ...), from the rows of Query 2.
+    Model 2 has no rows for companies without employees (companies only exist embedded in their employees)"""
+
+    sizes = np.array([row["numEmployees"] for row in query_spec(model, 2).rows()], dtype=np.int64)
+    bins = np.zeros(len(sizes), dtype=np.int64)
+    bins[sizes > 0] = np.floor(np.log2(sizes[sizes > 0])).astype(np.int64) + 1  # Bin k > 0 holds 2^(k-1) to 2^k - 1 employees
+    histogram = [{"min": 0 if k == 0 else 2 ** (k - 1), "max": 0 if k == 0 else 2 ** k - 1, "companies": int(count)}
+                 for k, count in enumerate(np.bincount(bins)) if count]
+    return {"companies": len(sizes), "max_employees": int(sizes.max()) if len(sizes) else 0, "bins": histogram}
+
+def compare_async(model_class, n, args, db, dataset=None):
+
+    """Wall-clock time (in seconds) of loading n documents in one process and (median, in milliseconds) of running the
+    selected queries, with the synchronous model and with AsyncModel. The read queries run one after the other with
+    the synchronous model and concurrently (asyncio.gather) with AsyncModel. The updates change fields that the reads
+    return (Query 4 renames every company), so they never run concurrently with anything: with both models every update
+    is timed on its own, after restoring a snapshot of the loaded data. Both loads write the same data, so both sets of
+    queries run the same work"""
+
+    model = model_class(client=db.client, db=db)
+    reads = [query for query in args.queries if query_spec(model, query).kind == 'read']
+    updates = [query for query in args.queries if query not in reads]
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # Hide the progress messages of the generator
+        model.data_generator(n, workers=1, seed=args.seed, dataset=dataset)
+    sync_load = time.perf_counter() - start_time
+    sync_reads_ns = []
+    for _ in range(args.repetitions):
+        start_time = time.perf_counter_ns()
+        for query in reads:
+            query_spec(model, query).execute()
+        sync_reads_ns.append(time.perf_counter_ns() - start_time)
+    sync_updates_ns = {}
+    if updates:
+        snapshot = Snapshot(db)
+        snapshot.take()
+        for query in updates:
+            sync_updates_ns[query] = []
+            for _ in range(args.repetitions):
+                snapshot.restore()  # Every execution updates the loaded data, outside of the timings
+                start_time = time.perf_counter_ns()
+                query_spec(model, query).execute()
+                sync_updates_ns[query].append(time.perf_counter_ns() - start_time)
+        snapshot.drop()
+
+    async_load, async_reads_ns, async_updates_ns = asyncio.run(time_async(model_class, n, args, reads, updates, db, dataset))
+    return {
+        "sync_load": sync_load,
+        "async_load": async_load,
+        "reads": reads,
+        "sync_reads": float(np.median(sync_reads_ns)) / 1e6 if reads else None,
+        "async_reads": float(np.median(async_reads_ns)) / 1e6 if reads else None,
+        "sync_updates": {query: float(np.median(times_ns)) / 1e6 for query, times_ns in sync_updates_ns.items()},
+        "async_updates": {query: float(np.median(times_ns)) / 1e6 for query, times_ns in async_updates_ns.items()}
+    }
+
+async def time_async(model_class, n, args, reads, updates, db, dataset=None):
+
+    """Load time (seconds), timings of the concurrent read queries and of every update run on its own (nanoseconds) of
+    AsyncModel, on its own async client. The snapshot restored before the updates is taken with the synchronous `db`
+    (the same database), while no async operation is outstanding"""
+
+    client = connect(asynchronous=True, **client_overrides(args))
+    try:
+        model = AsyncModel(model_class, client, client[config['database']['name']])
+        start_time = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):  # Hide the progress messages of the generator
+            await model.data_generator(n, seed=args.seed, dataset=dataset)
+        load_time = time.perf_counter() - start_time
+        reads_ns = []
+        for _ in range(args.repetitions):
+            start_time = time.perf_counter_ns()
+            if reads:
+                await model.run_queries(reads)
+            reads_ns.append(time.perf_counter_ns() - start_time)
+        updates_ns = {}
+        if updates:
+            snapshot = Snapshot(db)
+            snapshot.take()
+            for query in updates:
+                updates_ns[query] = []
+                for _ in range(args.repetitions):
+                    snapshot.restore()
+                    start_time = time.perf_counter_ns()
+                    await model.run_query(query)
+                    updates_ns[query].append(time.perf_counter_ns() - start_time)
+            snapshot.drop()
+        return load_time, reads_ns, updates_ns
+    finally:
+        await client.close()
+
+def print_company_sizes(histogram):
+    bins = "  ".join(f"{row['min'] if row['min'] == row['max'] else str(row['min']) + '-' + str(row['max'])}: {row['companies']}"
+                     for row in histogram["bins"])
+    print(f"Employees per company ({histogram['companies']} companies, largest {histogram['max_employees']}): {bins}")
+
+def geometric_sizes(smallest, largest, per_decade):
+
+    """Numbers of documents of a sweep: per_decade sizes per power of 10, from smallest to largest"""
+
+    n_sizes = int(round(np.log10(largest / smallest) * per_decade)) + 1
+    return sorted({int(round(n)) for n in np.geomspace(smallest, largest, max(n_sizes, 2))})
+
+def scaling_report(results):
+
+    """Growth exponent of every model and query (median time ~ n^k) and the sizes where the fastest of two models changes.
+    Every combination of query, variant and index profile is a separate series"""
+
+    exponents, crossovers = [], []
+    models = sorted({result["model"] for result in results})
+    for series in sorted({tuple(result[key] for key in SERIES) for result in results}):
+        labels = dict(zip(SERIES, series))
+        medians = {}  # model -> {n: median time}
+        for result in results:
+            if tuple(result[key] for key in SERIES) == series:
+                medians.setdefault(result["model"], {})[result["n"]] = result["median"]
+        for model in models:
+            sizes = sorted(medians.get(model, {}))
+            if len(sizes) > 1:
+                exponents.append({"model": model, **labels,
+                                  "exponent": float(fit_growth_exponent(sizes, [medians[model][n] for n in sizes]))})
+
+        # A crossover is a pair of consecutive sizes where the faster of two models is not the same
+        for i, model_a in enumerate(models):
+            for model_b in models[i + 1:]:
+                sizes = sorted(set(medians.get(model_a, {})) & set(medians.get(model_b, {})))
+                faster = [model_a if medians[model_a][n] <= medians[model_b][n] else model_b for n in sizes]
+                for j in range(1, len(sizes)):
+                    if faster[j] != faster[j - 1]:
+                        crossovers.append({**labels, "models": [model_a, model_b], "between": [sizes[j - 1], sizes[j]],
+                                           "faster_before": faster[j - 1], "faster_after": faster[j]})
+    return {"exponents": exponents, "crossovers": crossovers}
+
+def print_breakdown(results):
+    print(f"\n{'query':<16}{'server':>10}{'client':>10}{'docs':>12}{'keys':>12}  plan")
+    for result in results:
+        breakdown = result["explain"]
+        print(f"{query_label(result):<16}{breakdown['server_time_ms']:>10.2f}{breakdown['client_time_ms']:>10.2f}"
+              f"{breakdown['docs_examined']:>12}{breakdown['keys_examined']:>12}  {breakdown['plan']}")
+
+def series_label(row):
+    return f"Q{row['query']} ({row['variant']}, indexes: {row['index_profile']}, partitions: {row['partitions']})"
+
+def print_scaling_report(report):
+    print("Growth exponents (median time ~ n^k):")
+    for series in sorted({tuple(row[key] for key in SERIES) for row in report["exponents"]}):
+        rows = [e for e in report["exponents"] if tuple(e[key] for key in SERIES) == series]
+        print(f"- {series_label(rows[0])}: " + "  ".join(f"Model {e['model']}: {e['exponent']:.2f}" for e in rows))
+    if not report["crossovers"]:
+        print("No crossovers: the fastest model of every query is the same for all sizes.")
+    for crossover in report["crossovers"]:
+        n_before, n_after = crossover["between"]
+        print(f"- {series_label(crossover)}: Model {crossover['faster_after']} overtakes Model {crossover['faster_before']} "
+              f"between n = {n_before} and n = {n_after}")
+
+def client_overrides(args):
+
+    """Options of the MongoClient that the arguments change from the config file"""
+
+    return {} if args.compressors is None else {"compressors": args.compressors}
+
+def git_commit():
+
+    """Commit of the code being benchmarked (None outside of a git repository)"""
+
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the queries of the document models without user interaction.")
+    parser.add_argument('--models', type=int, nargs='+', choices=sorted(MODELS), default=sorted(MODELS), help="Models to benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000], help="Numbers of documents to generate")
+    parser.add_argument('--sweep', type=int, nargs=2, metavar=('MIN', 'MAX'),
+                        help="Run every size of a geometric range from MIN to MAX documents instead of --sizes")
+    parser.add_argument('--per-decade', type=int, default=3, help="Sizes per power of 10 of a --sweep (default: 3)")
+    parser.add_argument('--queries', type=int, nargs='+', choices=QUERIES, default=QUERIES, help="Queries to time")
+    parser.add_argument('--repetitions', type=int, default=10, help="Timed executions of every query")
+    parser.add_argument('--warmup', type=int, default=2, help="Untimed executions of every query before timing it")
+    parser.add_argument('--variants', action='store_true',
+                        help="Also time the optimized variants of the queries (QUERY_VARIANTS), after checking they give the baseline results")
+    parser.add_argument('--stream', action='store_true',
+                        help="Consume the results of read queries as a stream (counted, not kept) and report the time to the first row")
+    parser.add_argument('--batch-size', type=int, default=config['queries']['batch_size'],
+                        help="Documents per cursor batch when streaming (default: server default)")
+    parser.add_argument('--raw', action='store_true', default=config['queries']['raw_bson'],
+                        help="Decode the streamed results as RawBSONDocument (lazily)")
+    parser.add_argument('--partitions', type=int, nargs='+', default=[],
+                        help="Also run every aggregation split into this many _id ranges drained by concurrent threads, and report the speedup")
+    parser.add_argument('--views', action='store_true',
+                        help="Build the materialized views of queries 1 and 2, time reading them and the updates followed by their refresh")
+    parser.add_argument('--async', dest='compare_async', action='store_true',
+                        help="Also compare the wall-clock time of loading and of running the queries with the synchronous and the asyncio models")
+    parser.add_argument('--compressors', nargs='*', choices=['zstd', 'snappy', 'zlib'],
+                        help="Wire compressors to offer instead of the ones of config.json (no value: no compression)")
+    parser.add_argument('--reset', action='store_true',
+                        help="Take a server-side snapshot of the loaded data and restore it before every execution of the updates (queries 3 and 4)")
+    parser.add_argument('--no-explain', action='store_true',
+                        help="Do not explain the queries (no server/client time breakdown)")
+    parser.add_argument('--index-profiles', nargs='+', default=[config['loading']['index_profile']],
+                        help="Index profiles (INDEX_PROFILES of the models, 'none' for no secondary indexes) to run every query with")
+    parser.add_argument('--workers', type=int, default=config['generation']['workers'], help="Number of generation processes")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the data generation")
+    parser.add_argument('--canonical', action='store_true', help="Load the same canonical dataset into every model")
+    parser.add_argument('--dataset', metavar='PATH', help="Directory of a canonical dataset (implies --canonical)")
+    parser.add_argument('--cache', action='store_true', help="Use the on-disk dataset cache")
+    parser.add_argument('--output', default='benchmark_results',
+                        help="Prefix of the result files (<output>.json and <output>.csv)")
+    args = parser.parse_args()
+    # The driver silently runs without a compressor whose package is missing, which would time an uncompressed run
+    missing = [name for name in args.compressors or [] if name not in available_compressors(args.compressors)]
+    if missing:
+        parser.error(f"Unavailable compressors: {', '.join(missing)} (install the packages of requirements.txt)")
+    return args
+
+def write_results(prefix, metadata, results, scaling=None):
+
+    """Save the results as JSON (with the raw timings and the run metadata) and as CSV (one row per query)"""
+
+    with open(f"{prefix}.json", 'w') as json_file:
+        json.dump({"metadata": metadata, "results": results, "scaling": scaling}, json_file, indent=2)
+    with open(f"{prefix}.csv", 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["model", "n", "index_profile", "query", "variant", "partitions", "kind", "repetitions"] + [f"{name}_ms" for name in STATISTICS]
+                        + BREAKDOWN + ["plan", "rows", "first_row_median_ms", "speedup"])
+        for result in results:
+            writer.writerow([result["model"], result["n"], result["index_profile"], result["query"], result["variant"], result["partitions"], result["kind"], len(result["times_ns"])]
+                            + [result[name] for name in STATISTICS]
+                            + [result["explain"][name] if result["explain"] else None for name in BREAKDOWN + ["plan"]]
+                            + [result["rows"], result["first_row"]["median"] if result["first_row"] else None, result["speedup"]])
+
+def main():
+    args = parse_args()
+    args.seed = resolve_seed(args.seed)
+    if args.sweep:
+        args.sizes = geometric_sizes(*args.sweep, args.per_decade)
+        print(f"Sweep over n = {', '.join(str(n) for n in args.sizes)}")
+    cache = DatasetCache() if args.cache else None
+    stream = {"batch_size": args.batch_size, "raw": args.raw} if args.stream else None
+    datasets = {}  # Canonical datasets generated in this run (by number of documents)
+
+    # Connect to MongoDB from environment variable
+    client = connect(**client_overrides(args))
+    db = client[config['database']['name']]
+
+    metadata = {
+        "commit": git_commit(),
+        "date": datetime.datetime.now().isoformat(timespec='seconds'),
+        "config": config,
+        "args": vars(args),
+        "connection": connection_settings(**client_overrides(args)),  # Pool size, compressors, write and read concerns
+        "company_sizes": [],  # Histogram of the employees per company of every loaded model and size
+        "async": [],  # Sync vs async wall-clock times of every model and size (--async)
+        "snapshots": []  # Time to take the snapshot and to restore it, for every model and size (--reset)
+    }
+    results = []
+    for n in args.sizes:
+        for model_id in args.models:
+            model = MODELS[model_id](client=client, db=db)
+            if args.compare_async:
+                # Single-process loads, before the data of the query benchmark is loaded
+                print(f"Comparing the synchronous and asyncio Model {model_id} with {n} documents...")
+                comparison = compare_async(MODELS[model_id], n, args, db, canonical_dataset(args, n, datasets))
+                metadata["async"].append({"model": model_id, "n": n, "queries": args.queries, **comparison})
+                print(f"Load: {comparison['sync_load']:.3f} s sync, {comparison['async_load']:.3f} s async.")
+                if comparison['reads']:
+                    print(f"Read queries {', '.join(str(query) for query in comparison['reads'])}: {comparison['sync_reads']:.2f} ms one after the other, "
+                          f"{comparison['async_reads']:.2f} ms concurrently (median of {args.repetitions})")
+                for query, sync_ms in comparison['sync_updates'].items():
+                    print(f"Query {query} (update, on the restored data): {sync_ms:.2f} ms sync, "
+                          f"{comparison['async_updates'][query]:.2f} ms async (median of {args.repetitions})")
+            print(f"Loading {n} documents into Model {model_id}...")
+            with contextlib.redirect_stdout(io.StringIO()):  # Hide the progress messages of the generator
+                load_data(model, n, args, datasets, cache)
+            histogram = company_size_histogram(model)  # Before the updates of the queries
+            metadata["company_sizes"].append({"model": model_id, "n": n, **histogram})
+            print_company_sizes(histogram)
+            variants = checked_variants(model, args.queries) if args.variants else {query: [BASELINE] for query in args.queries}
+            views = build_views(model) if args.views else None
+            snapshot = Snapshot(db) if args.reset else None
+            if snapshot:
+                print(f"Snapshot of the loaded data taken in {snapshot.take():.3f} seconds.")
+            reset = snapshot.restore if snapshot else None
+
+            for profile in args.index_profiles:
+                if profile != NO_INDEXES and profile not in model.INDEX_PROFILES:
+                    print(f"Model {model_id} has no index profile '{profile}', skipped.")
+                    continue
+                indexes = apply_index_profile(model, profile)  # Built after the bulk load, over all the data
+                for index in indexes:
+                    print(f"Index {index['index']} on {index['collection']}: built in {index['build_time']:.3f} seconds, "
+                          f"{index['size_bytes'] / 1024 ** 2:.1f} MB")
+
+                print(f"\nModel {model_id}, n = {n}, indexes: {profile} ({args.repetitions} repetitions, {args.warmup} warmup, times in ms)")
+                print(f"{'query':<16}" + "".join(f"{name:>10}" for name in STATISTICS))
+                for query in args.queries:
+                    for variant in variants[query]:
+                        spec = query_spec(model, query, variant)
+                        labels = {"model": model_id, "n": n, "index_profile": profile, "indexes": indexes,
+                                  "query": query, "variant": variant}
+                        baseline = benchmark_query(spec, {**labels, "partitions": 1}, args, stream, reset)
+                        results.append(baseline)
+                        if isinstance(spec, AggregateQuery):
+                            # The same pipeline split into ranges of the driving collection, drained concurrently
+                            field = getattr(model, 'PARTITION_FIELDS', {}).get(query, "_id")
+                            for partitions in args.partitions:
+                                result = benchmark_query(PartitionedQuery(spec, partitions, field), {**labels, "partitions": partitions}, args, stream)
+                                result["speedup"] = baseline["median"] / result["median"]
+                                print(f"{'  speedup':<16}{result['speedup']:>10.2f}x with {partitions} threads")
+                                results.append(result)
+                    if views is not None:
+                        # Reads served by a view, and updates that also pay for the refresh of the views
+                        spec = query_spec(model, query)
+                        view_spec = views.query(query) if spec.kind == 'read' else RefreshedUpdate(spec, views)
+                        if view_spec is not None:
+                            labels = {"model": model_id, "n": n, "index_profile": profile, "indexes": indexes, "query": query,
+                                      "variant": "view" if spec.kind == 'read' else "refresh", "partitions": 1}
+                            results.append(benchmark_query(view_spec, labels, args, stream, reset))
+                if views is not None:
+                    print_view_costs([result for result in results if result["model"] == model_id and result["n"] == n
+                                      and result["index_profile"] == profile])
+                if not args.no_explain:
+                    print_breakdown([result for result in results if result["model"] == model_id and result["n"] == n
+                                     and result["index_profile"] == profile])
+                if snapshot:
+                    snapshot.restore()  # The queries of the next index profile read the loaded data too
+                print()
+            if snapshot:
+                if snapshot.restore_times:
+                    print(f"Restored the snapshot {len(snapshot.restore_times)} times in {np.median(snapshot.restore_times):.3f} seconds (median).\n")
+                metadata["snapshots"].append({"model": model_id, "n": n, "restore_times": snapshot.restore_times})
+                snapshot.drop()
+        datasets.pop(n, None)  # The canonical dataset of this size is not needed anymore
+        write_results(args.output, metadata, results)  # Partial results, kept if a long sweep is interrupted
+
+    scaling = None
+    if len(args.sizes) > 1:
+        scaling = scaling_report(results)
+        print_scaling_report(scaling)
+
+    write_results(args.output, metadata, results, scaling)
+    print(f"Results saved in {args.output}.json and {args.output}.csv.")
+
+    client.close()  # Close the connection to MongoDB
+
+if __name__ == '__main__':
+    main()
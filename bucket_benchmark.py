@@ -0,0 +1,98 @@
+# coding=utf-8
+from model3 import Model3
+from model3_buckets import Model3Buckets
+from benchmark import STATISTICS, summarize, time_query
+from queries import query_spec
+from snapshots import Snapshot
+import argparse
+import contextlib
+import io
+import json
+from connection import connect
+from pymongo.errors import DocumentTooLarge
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Load configuration file
+with open('config.json', 'r') as config_file:
+    config = json.load(config_file)
+
+LAYOUTS = {"array": Model3, "buckets": Model3Buckets}
+
+def document_sizes(db):
+
+    """Largest and average BSON size of the Company documents and length of the longest employees array"""
+
+    stats = next(db['Company'].aggregate([
+        {"$project": {"size": {"$bsonSize": "$$ROOT"}, "employees": {"$size": "$employees"}}},
+        {"$group": {"_id": None, "max_size": {"$max": "$size"}, "avg_size": {"$avg": "$size"},
+                    "max_employees": {"$max": "$employees"}, "documents": {"$sum": 1}}}
+    ]))
+    stats.pop("_id")
+    return stats
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare Model 3 with one employees array per company and with employee buckets as companies grow.")
+    parser.add_argument('--n', type=int, default=100000, help="Number of documents to generate (people and companies)")
+    # With the default n, the last ratio puts about 100,000 employees (~24 MB) in one company: more than a single
+    # employees array can hold in a 16 MB document, so only the buckets can load it
+    parser.add_argument('--ratios', type=int, nargs='+', default=[50, 500, 5000, 20000, 100000],
+                        help="People per company (company sizes) to compare (at most n)")
+    parser.add_argument('--repetitions', type=int, default=5, help="Timed executions of every query")
+    parser.add_argument('--warmup', type=int, default=1, help="Untimed executions of every query before timing it")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the data generation")
+    parser.add_argument('--reset', action='store_true',
+                        help="Restore a server-side snapshot of the loaded data before every execution of the updates (queries 3 and 4)")
+    parser.add_argument('--output', help="JSON file where the results are saved")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    # Connect to MongoDB from environment variable
+    client = connect()
+    db = client[config['database']['name']]
+
+    results = []
+    print(f"Model 3 layouts with n = {args.n:,} ({args.repetitions} repetitions, median times in ms, bucket size {config['generation']['bucket_size']})")
+    print(f"{'ratio':>7}{'layout':>9}{'docs':>9}{'max KB':>9}{'max array':>11}" + "".join(f"{'Q' + str(q):>10}" for q in range(1, 5)))
+    for ratio in args.ratios:
+        if args.n // ratio == 0:
+            print(f"{ratio:>7}  skipped: fewer than one company with n = {args.n:,}")
+            continue
+        for layout, model_class in LAYOUTS.items():
+            model = model_class(client=client, db=db)
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):  # Hide the progress messages of the generator
+                    # Assembled companies, so a company over 16 MB is rejected by the driver before it is sent
+                    model.data_generator(args.n, mode='assemble', workers=1, seed=args.seed, person_company_ratio=ratio)
+            except DocumentTooLarge:
+                print(f"{ratio:>7}{layout:>9}  a company does not fit in one 16 MB document")
+                continue
+            sizes = document_sizes(db)
+            snapshot = Snapshot(db) if args.reset else None
+            if snapshot:
+                snapshot.take()
+            medians = {}
+            for query in range(1, 5):
+                # Queries 3 and 4 are updates: without --reset, every execution runs on the data left by the previous ones
+                times_ns, _, _ = time_query(query_spec(model, query), args.repetitions, args.warmup, reset=snapshot.restore if snapshot else None)
+                statistics = summarize(times_ns)
+                medians[query] = statistics["median"]
+                results.append({"ratio": ratio, "layout": layout, "query": query, **sizes, **statistics, "times_ns": times_ns})
+            print(f"{ratio:>7}{layout:>9}{sizes['documents']:>9}{sizes['max_size'] / 1024:>9.0f}{sizes['max_employees']:>11}"
+                  + "".join(f"{medians[query]:>10.2f}" for query in range(1, 5)))
+            if snapshot:
+                snapshot.drop()
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({"n": args.n, "bucket_size": config['generation']['bucket_size'], "statistics": STATISTICS, "results": results}, output_file, indent=2)
+        print(f"Results saved in {args.output}.")
+
+    client.close()  # Close the connection to MongoDB
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+# coding=utf-8
+import asyncio
+import time
+import json
+from connection import load_write_concern
+
+# Load configuration
+with open('config.json', 'r') as config_file:
+    config = json.load(config_file)
+
+class BulkLoader:
+
+    """Buffer documents and write operations for one collection and send them to MongoDB in unordered batches
+    (with the load write concern of the config file)"""
+
+    def __init__(self, collection, batch_size=None):
+        self.collection = collection.with_options(write_concern=load_write_concern())
+        self.batch_size = batch_size or config['loading']['batch_size']  # Number of buffered items that triggers a flush
+        self.documents = []  # Buffered documents (sent with insert_many)
+        self.operations = []  # Buffered write models, e.g. UpdateOne (sent with bulk_write)
+        self.n_written = 0  # Number of documents inserted or operations applied so far
+        self.write_time = 0.0  # Time spent waiting for the server (seconds)
+        self.start_time = None  # Set when the first item is buffered
+
+    def insert(self, document):
+        """Buffer a document to be inserted"""
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+        self.documents.append(document)
+        if len(self.documents) >= self.batch_size:
+            self.flush()
+
+    def write(self, operation):
+        """Buffer a write model (InsertOne, UpdateOne, ...) to be sent with bulk_write"""
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+        self.operations.append(operation)
+        if len(self.operations) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Send every buffered document and operation to the server"""
+        start_time = time.perf_counter()
+        if self.documents:
+            # Unordered inserts let the server apply the batch without stopping at the first error
+            self.collection.insert_many(self.documents, ordered=False)
+            self.n_written += len(self.documents)
+            self.documents = []
+        if self.operations:
+            self.collection.bulk_write(self.operations, ordered=False)
+            self.n_written += len(self.operations)
+            self.operations = []
+        self.write_time += time.perf_counter() - start_time
+
+    def close(self):
+        """Flush the remaining items and print the load throughput"""
+        self.flush()
+        self.report()
+
+    def report(self):
+        """Print the number of written items and the docs/sec achieved (overall and server-side only)"""
+        if self.start_time is None:
+            print(f"Wrote 0 documents to {self.collection.name}.")
+            return
+        total_time = time.perf_counter() - self.start_time  # Includes the time spent generating the documents
+        total_rate = self.n_written / total_time if total_time > 0 else float('inf')
+        write_rate = self.n_written / self.write_time if self.write_time > 0 else float('inf')
+        print(f"Wrote {self.n_written} documents/updates to {self.collection.name} in {total_time:.3f} seconds "
+              f"({total_rate:.0f} docs/sec overall, {write_rate:.0f} docs/sec on writes, batch size {self.batch_size}).")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()  # Only flush if the block finished without errors
+
+class AsyncBulkLoader:
+
+    """Asyncio version of BulkLoader for pymongo async collections: every full batch is sent as a task, so the caller
+    prepares the next batches while up to `max_in_flight` batches are being written. A batch with write models (e.g.
+    $push updates) first waits for the earlier batches of the collection, which may insert the documents it updates"""
+
+    def __init__(self, collection, batch_size=None, max_in_flight=None):
+        self.collection = collection.with_options(write_concern=load_write_concern())
+        self.batch_size = batch_size or config['loading']['batch_size']  # Number of buffered items that triggers a flush
+        self.max_in_flight = max_in_flight or config['loading']['queue_size']  # Batches being written at the same time
+        self.documents = []  # Buffered documents (sent with insert_many)
+        self.operations = []  # Buffered write models, e.g. UpdateOne (sent with bulk_write)
+        self.in_flight = set()  # Tasks of the batches sent and not finished yet
+        self.n_written = 0  # Number of documents inserted or operations applied so far
+        self.start_time = None  # Set when the first item is buffered
+
+    async def insert(self, document):
+        """Buffer a document to be inserted"""
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+        self.documents.append(document)
+        if len(self.documents) >= self.batch_size:
+            await self.flush()
+
+    async def write(self, operation):
+        """Buffer a write model (InsertOne, UpdateOne, ...) to be sent with bulk_write"""
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+        self.operations.append(operation)
+        if len(self.operations) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        """Send the buffered documents and operations as a new task, once a slot of the in-flight batches is free"""
+        if not (self.documents or self.operations):
+            return
+        documents, operations = self.documents, self.operations
+        self.documents, self.operations = [], []
+        if operations:
+            await self.wait()  # Updates must see every earlier insert
+        while len(self.in_flight) >= self.max_in_flight:
+            done, self.in_flight = await asyncio.wait(self.in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()  # Raise the error of a failed batch
+        self.in_flight.add(asyncio.create_task(self._send(documents, operations)))
+
+    async def wait(self):
+        """Wait until every batch sent so far is written"""
+        in_flight, self.in_flight = self.in_flight, set()
+        await asyncio.gather(*in_flight)
+
+    async def close(self):
+        """Flush the remaining items, wait for every batch and print the load throughput"""
+        await self.flush()
+        await self.wait()
+        self.report()
+
+    async def _send(self, documents, operations):
+        if documents:
+            await self.collection.insert_many(documents, ordered=False)
+            self.n_written += len(documents)
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+            self.n_written += len(operations)
+
+    def report(self):
+        """Print the number of written items and the docs/sec achieved"""
+        if self.start_time is None:
+            print(f"Wrote 0 documents to {self.collection.name}.")
+            return
+        total_time = time.perf_counter() - self.start_time  # Includes the time spent generating the documents
+        total_rate = self.n_written / total_time if total_time > 0 else float('inf')
+        print(f"Wrote {self.n_written} documents/updates to {self.collection.name} in {total_time:.3f} seconds "
+              f"({total_rate:.0f} docs/sec, up to {self.max_in_flight} batches in flight, batch size {self.batch_size}).")
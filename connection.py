@@ -0,0 +1,62 @@
+# coding=utf-8
+import json
+import os
+from pymongo import AsyncMongoClient, MongoClient
+from pymongo.compression_support import validate_compressors
+from pymongo.read_concern import ReadConcern
+from pymongo.write_concern import WriteConcern
+
+# Load configuration
+with open('config.json', 'r') as config_file:
+    config = json.load(config_file)
+
+def client_options(**overrides):
+
+    """Options of the MongoClient from the connection section of the config file (connection pool size and wire
+    compressors), with the given overrides (MongoClient option names)"""
+
+    options = {"maxPoolSize": config['connection']['max_pool_size']}
+    if config['connection']['compressors']:
+        options["compressors"] = config['connection']['compressors']  # Offered to the server in this order of preference
+    options.update(overrides)
+    return options
+
+def connect(asynchronous=False, **overrides):
+
+    """Client of the MongoDB server of the MONGO_PORT environment variable, with the options of the config file
+    (an AsyncMongoClient if asynchronous)"""
+
+    client_class = AsyncMongoClient if asynchronous else MongoClient
+    return client_class(os.getenv('MONGO_PORT'), **client_options(**overrides))
+
+def load_write_concern():
+
+    """Write concern of the bulk loads (e.g. w=1 without waiting for the journal, faster than the default of the queries)"""
+
+    return WriteConcern(**config['connection']['load_write_concern'])
+
+def query_read_concern():
+
+    """Read concern of the read queries (level null: the server default)"""
+
+    return ReadConcern(config['connection']['query_read_concern'])
+
+def available_compressors(compressors):
+
+    """Compressors of the list that the driver can use in this Python environment (the others are ignored by it)"""
+
+    return validate_compressors(None, list(compressors))  # Copy: unavailable compressors are removed from the list
+
+def connection_settings(**overrides):
+
+    """Settings used by a run, to be saved with its results: client options (with the compressors that this Python
+    environment supports, as the others are ignored by the driver), load write concern and query read concern"""
+
+    options = client_options(**overrides)
+    if "compressors" in options:
+        options["compressors"] = available_compressors(options["compressors"])
+    return {
+        "client": options,
+        "load_write_concern": load_write_concern().document,
+        "query_read_concern": query_read_concern().document
+    }
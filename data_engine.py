@@ -0,0 +1,254 @@
+# coding=utf-8
+import datetime
+import json
+import re
+import numpy as np
+
+# Load configuration
+with open('config.json', 'r') as config_file:
+    config = json.load(config_file)
+
+def make_engine(engine=None, seed=None):
+
+    """Create the synthetic data engine selected in the config file ("numpy" or "faker")"""
+
+    engine = engine or config['generation']['engine']
+    languages = config['generation']['languages']
+    batch_size = config['generation']['engine_batch_size']
+    if engine == 'numpy':
+        return NumpyEngine(languages, seed=seed, batch_size=batch_size)
+    if engine == 'faker':
+        return FakerEngine(languages, seed=seed, batch_size=batch_size)
+    raise ValueError(f"Unknown data engine: {engine}")
+
+class CompanySizes:
+
+    """Distribution of the people among the companies (generation.company_sizes in the config file):
+    - uniform: every person works at a company chosen uniformly at random
+    - zipf: company i (in generation order, from 0) is chosen with a probability proportional to 1 / (i + 1)^zipf_exponent
+    - giants: the first companies employ the fractions of the people listed in `giants`, and the rest of the people
+      are assigned uniformly at random to the other companies
+
+    The weights are only computed for the range of companies being generated (and added up in blocks), so no array
+    with one entry per company is ever built. A CompanySizes covers the companies start:stop of a run of n_companies"""
+
+    DISTRIBUTIONS = ('uniform', 'zipf', 'giants')
+    BLOCK_SIZE = 1000000  # Companies per block when adding up the weights of a range
+
+    def __init__(self, n_companies, start=0, stop=None, distribution=None, zipf_exponent=None, giants=None):
+        settings = config['generation']['company_sizes']
+        self.n_companies = n_companies  # Companies of the whole run (the giants and the weights depend on it)
+        self.start = start
+        self.stop = n_companies if stop is None else stop
+        self.distribution = distribution or settings['distribution']
+        self.zipf_exponent = settings['zipf_exponent'] if zipf_exponent is None else zipf_exponent
+        self.giants = list(settings['giants'] if giants is None else giants)[:n_companies]  # Fractions of the people
+        if self.distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"Unknown company size distribution: {self.distribution} (available: {', '.join(self.DISTRIBUTIONS)})")
+        if self.distribution == 'giants' and (min(self.giants, default=0) < 0 or sum(self.giants) > 1):
+            raise ValueError("The giant companies must employ fractions of the people that add up to at most 1")
+
+    def shard(self, start, stop):
+        """Same distribution restricted to the companies start:stop of this range"""
+        return CompanySizes(self.n_companies, self.start + start, self.start + stop, self.distribution, self.zipf_exponent, self.giants)
+
+    def weights(self, start, stop):
+        """Unnormalized probabilities of the companies start:stop of this range"""
+        index = np.arange(self.start + start, self.start + stop)
+        if self.distribution == 'zipf':
+            return (index + 1.0) ** -self.zipf_exponent
+        if self.distribution == 'giants':
+            n_giants = len(self.giants)
+            n_others = self.n_companies - n_giants
+            weights = np.full(len(index), (1 - sum(self.giants)) / n_others if n_others else 0.0)
+            is_giant = index < n_giants
+            weights[is_giant] = np.array(self.giants, dtype=np.float64)[index[is_giant]]
+            return weights
+        return np.ones(len(index))
+
+    def total(self, start=0, stop=None):
+        """Sum of the weights of the companies start:stop of this range (all of them by default)"""
+        stop = self.stop - self.start if stop is None else stop
+        if self.distribution == 'uniform':
+            return float(stop - start)
+        return float(sum(self.weights(block, min(block + self.BLOCK_SIZE, stop)).sum() for block in range(start, stop, self.BLOCK_SIZE)))
+
+def company_document(fake):
+
+    """Generate a company document (shared fields of all models) with Faker"""
+
+    # Generate random data with consistency
+    c_name = fake.company()
+    c_domain = "@" + re.sub(r'[^\w]', '', c_name).lower() + ".com"
+    c_email = 'customers' + c_domain
+    c_url = c_name.replace(" ", "").lower() + ".com"
+
+    # Create custom company IDs (not MongoDB default ObjectId)
+    company_id = fake.uuid4()
+
+    return {
+        "_id": company_id,
+        "domain": c_domain,
+        "email": c_email,
+        "name": c_name,
+        "url": c_url,
+        "vatNumber": fake.uuid4()
+    }
+
+class FakerEngine:
+
+    """Generate people one row at a time with Faker calls (original implementation)"""
+
+    def __init__(self, languages, seed=None, batch_size=100000):
+        from faker import Faker  # Imported on first use, so that running queries does not pay for loading Faker
+        self.fake = Faker(languages)  # Create a Faker object with multiple languages
+        if seed is not None:
+            # Every locale needs its own seed (with a shared one all locales return the same values), and the choice
+            # of the locale for each call uses Faker's shared random generator
+            locale_seeds = np.random.SeedSequence(seed).generate_state(len(self.fake.locales) + 1).tolist()
+            for locale, locale_seed in zip(self.fake.locales, locale_seeds):
+                self.fake.seed_locale(locale, locale_seed)
+            Faker.seed(locale_seeds[-1])
+        self.rng = np.random.default_rng(seed)  # Used to draw the number of employees of each company
+        self.batch_size = batch_size
+
+    def companies(self, n_companies):
+        """Generate a list of n_companies company documents"""
+        return [company_document(self.fake) for x in range(n_companies)]
+
+    def employee_counts(self, weights, remaining_people, remaining_weight):
+        """Number of employees of each of the next companies (given by their CompanySizes weights), when the
+        remaining_people are assigned at random to the remaining companies, whose weights add up to remaining_weight.
+        Drawing the counts chunk by chunk (a binomial for the chunk and a multinomial inside it) gives the same
+        distribution as assigning every person at once"""
+        chunk_weight = weights.sum()
+        if chunk_weight <= 0:
+            return np.zeros(len(weights), dtype=np.int64)  # Companies that nobody can work at
+        share = chunk_weight / remaining_weight
+        chunk_people = self.rng.binomial(remaining_people, share) if share < 1 else remaining_people
+        return self.rng.multinomial(chunk_people, weights / chunk_weight)
+
+    def people(self, company_indices, company_domains):
+        """Generate one person document for each entry of company_indices (index into company_domains)"""
+        fake = self.fake
+        people = []
+        for company_index in company_indices:
+
+            # Generate random data with consistency
+            person_id = fake.uuid4()
+            date_of_birth = fake.date_of_birth(minimum_age=18, maximum_age=80)
+            date_of_birth_dt = datetime.datetime.combine(date_of_birth, datetime.time.min)  # Convert date_of_birth to datetime.datetime object to ensure compatibility with MongoDB
+            age = datetime.datetime.now().year - date_of_birth.year
+            first_name = fake.first_name()
+            last_name = fake.last_name()
+            full_name = first_name + " " + last_name
+            email = first_name.lower() + '.' + last_name.lower() + '@' + 'example.com'
+
+            # Create custom company email from the company name
+            company_email = first_name.lower() + '.' + last_name.lower() + company_domains[company_index]
+
+            people.append({
+                "_id": person_id,
+                "age": age,
+                "companyEmail": company_email,
+                "dateOfBirth": date_of_birth_dt,
+                "email": email,
+                "firstName": first_name,
+                "fullName": full_name,
+                "sex": fake.random_element(elements=('M', 'F', 'O'))
+            })
+        return people
+
+class NumpyEngine(FakerEngine):
+
+    """Generate people in NumPy batches sampled from pre-built locale name pools (companies still use Faker)"""
+
+    SEXES = np.array(['M', 'F', 'O'])
+    HEX_DIGITS = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+
+    def __init__(self, languages, seed=None, batch_size=100000):
+        super().__init__(languages, seed=seed, batch_size=batch_size)
+        if isinstance(languages, str):
+            languages = [languages]
+
+        # Build the name pools once: Faker picks one of the locales uniformly for every call, and then a name
+        # from that locale (weighted when the locale gives weights), so both are merged into one distribution
+        self.first_names, self.first_name_p = self._name_pool(languages, 'first_names')
+        self.last_names, self.last_name_p = self._name_pool(languages, 'last_names')
+
+        # Birth dates are uniform between the dates of birth of people aged 80 and 18 (as fake.date_of_birth)
+        today = datetime.date.today()
+        self.min_birth_day = np.datetime64(self._years_before(today, 81), 'D') + 1
+        self.n_birth_days = int((np.datetime64(self._years_before(today, 18), 'D') - self.min_birth_day).astype(np.int64)) + 1
+        self.current_year = datetime.datetime.now().year
+
+    @staticmethod
+    def _years_before(date, years):
+        try:
+            return date.replace(year=date.year - years)
+        except ValueError:  # 29 February in a non-leap year
+            return date.replace(year=date.year - years, day=28)
+
+    @staticmethod
+    def _name_pool(languages, attribute):
+        from faker import Faker
+        names, probabilities = [], []
+        for language in languages:
+            provider = Faker(language).provider('faker.providers.person')
+            pool = getattr(provider, attribute)
+            if isinstance(pool, dict):  # Weighted names (OrderedDict of name: weight)
+                weights = np.array(list(pool.values()), dtype=np.float64)
+                pool = list(pool.keys())
+            else:
+                weights = np.ones(len(pool), dtype=np.float64)
+            names.extend(pool)
+            probabilities.append(weights / weights.sum() / len(languages))
+        return np.array(names), np.concatenate(probabilities)
+
+    def _uuid4(self, n):
+        """Random version 4 UUID strings, built for the whole batch at once"""
+        raw = self.rng.integers(0, 256, size=(n, 16), dtype=np.uint8)
+        raw[:, 6] = (raw[:, 6] & 0x0f) | 0x40  # Version 4
+        raw[:, 8] = (raw[:, 8] & 0x3f) | 0x80  # RFC 4122 variant
+        digits = np.empty((n, 32), dtype=np.uint8)
+        digits[:, 0::2] = self.HEX_DIGITS[raw >> 4]
+        digits[:, 1::2] = self.HEX_DIGITS[raw & 0x0f]
+        dash = np.full((n, 1), ord('-'), dtype=np.uint8)
+        chars = np.hstack([digits[:, :8], dash, digits[:, 8:12], dash, digits[:, 12:16], dash, digits[:, 16:20], dash, digits[:, 20:]])
+        return np.ascontiguousarray(chars).view('S36').ravel().astype('U36')
+
+    def people(self, company_indices, company_domains):
+        n = len(company_indices)
+        rng = self.rng
+
+        # Sample every column of the batch
+        person_ids = self._uuid4(n)
+        first_names = self.first_names[rng.choice(len(self.first_names), size=n, p=self.first_name_p)]
+        last_names = self.last_names[rng.choice(len(self.last_names), size=n, p=self.last_name_p)]
+        dates_of_birth = self.min_birth_day + rng.integers(0, self.n_birth_days, size=n)
+        sexes = self.SEXES[rng.integers(0, len(self.SEXES), size=n)]
+
+        # Build the derived fields in bulk
+        ages = self.current_year - (dates_of_birth.astype('datetime64[Y]').astype(np.int64) + 1970)
+        full_names = np.char.add(np.char.add(first_names, " "), last_names)
+        email_names = np.char.add(np.char.add(np.char.lower(first_names), '.'), np.char.lower(last_names))
+        emails = np.char.add(email_names, '@example.com')
+        company_emails = np.char.add(email_names, np.asarray(company_domains)[company_indices])
+
+        # Convert to Python documents (datetime64[us] converts to datetime.datetime, as required by MongoDB)
+        return [
+            {
+                "_id": person_id,
+                "age": age,
+                "companyEmail": company_email,
+                "dateOfBirth": date_of_birth,
+                "email": email,
+                "firstName": first_name,
+                "fullName": full_name,
+                "sex": sex
+            }
+            for person_id, age, company_email, date_of_birth, email, first_name, full_name, sex in zip(
+                person_ids.tolist(), ages.tolist(), company_emails.tolist(), dates_of_birth.astype('datetime64[us]').tolist(),
+                emails.tolist(), first_names.tolist(), full_names.tolist(), sexes.tolist()
+            )
+        ]
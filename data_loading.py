@@ -0,0 +1,80 @@
+# coding=utf-8
+import json
+import os
+from dataset import Dataset
+
+# Load configuration
+with open('config.json', 'r') as config_file:
+    config = json.load(config_file)
+
+# Canonical dataset shared by all models (None when every model generates its own data)
+def canonical_dataset(args, n, datasets):
+    if not (args.canonical or args.dataset):
+        return None
+    if args.dataset and os.path.exists(os.path.join(args.dataset, 'params.json')):
+        dataset = Dataset.load(args.dataset)
+        if dataset.n != n:
+            print(f"Using the {dataset.n} documents of the dataset in {args.dataset}.")
+        return dataset
+    if n not in datasets:
+        print(f"Generating the canonical dataset of {n} documents...")
+        datasets[n] = Dataset.generate(n, seed=args.seed)
+        if args.dataset:
+            datasets[n].save(args.dataset)
+            print(f"Saved the dataset in {args.dataset}.")
+    return datasets[n]
+
+# Check that the database already holds the data of a model generated with n documents: every collection of
+# model.DOCUMENTS exists, has the expected number of people or companies and its documents have the model's fields.
+# Returns the list of problems found (empty if the queries can run on the existing data)
+def check_existing_data(m, n):
+    n_companies = n // config['generation']['person_company_ratio']
+    expected = {"company": n_companies, "person": n - n_companies}
+    existing = set(m.db.list_collection_names())
+    problems = []
+    for collection_name, (unit, filter, fields) in type(m).DOCUMENTS.items():
+        if collection_name not in existing:
+            problems.append(f"Collection {collection_name} does not exist.")
+            continue
+        collection = m.db[collection_name]
+        # Without a filter the count comes from the collection metadata (no scan)
+        count = collection.count_documents(filter) if filter else collection.estimated_document_count()
+        if count != expected[unit]:
+            problems.append(f"Collection {collection_name} has {count} {unit} documents instead of {expected[unit]}.")
+        document = collection.find_one(filter)
+        missing = [field for field in fields if document is None or not _has_field(document, field)]
+        if document is not None and missing:
+            problems.append(f"The documents of {collection_name} have no field {', '.join(missing)}: they were loaded by another model.")
+    return problems
+
+def _has_field(document, path):
+    for part in path.split('.'):
+        if not isinstance(document, dict) or part not in document:
+            return False
+        document = document[part]
+    return True
+
+# Load the data of a model: from the dataset cache if possible, otherwise generate it (and cache it)
+def load_data(m, n, args, datasets, cache):
+    model_name = type(m).__name__
+    params = {
+        "seed": args.seed,
+        "source": "canonical" if (args.canonical or args.dataset) else f"workers={args.workers}"
+    }
+    dataset = None
+    if args.dataset and os.path.exists(os.path.join(args.dataset, 'params.json')):
+        # A saved dataset is used whatever its n and seed: the cache is keyed by the parameters it was generated with
+        dataset = canonical_dataset(args, n, datasets)
+        params.update((name, value) for name, value in dataset.params.items() if name != "n")
+        n = dataset.n
+    if model_name == "Model3":
+        params["mode"] = config['generation']['model3_mode']
+    if model_name == "Model3Buckets":
+        params["bucket_size"] = config['generation']['bucket_size']
+    if cache is not None and cache.restore(m.db, model_name, n, **params):
+        return
+    if dataset is None:
+        dataset = canonical_dataset(args, n, datasets)
+    m.data_generator(n, workers=args.workers, seed=args.seed, dataset=dataset)
+    if cache is not None:
+        cache.store(m.db, model_name, n, **params)
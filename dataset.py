@@ -0,0 +1,124 @@
+# coding=utf-8
+import json
+import os
+import numpy as np
+from data_engine import make_engine
+from parallel_generation import resolve_seed, derive_seeds
+from pipeline import company_chunks
+
+# Load configuration
+with open('config.json', 'r') as config_file:
+    config = json.load(config_file)
+
+class Dataset:
+
+    """Canonical people/companies dataset kept as columns (one NumPy array per field).
+
+    The people are stored grouped by company: the employees of company i are the rows
+    employee_offsets[i]:employee_offsets[i + 1] of the person columns. The same dataset can be projected into the
+    document shapes of every model, so all models are loaded (and benchmarked) with exactly the same data"""
+
+    COMPANY_FIELDS = ["_id", "domain", "email", "name", "url", "vatNumber"]
+    PERSON_FIELDS = ["_id", "age", "companyEmail", "dateOfBirth", "email", "firstName", "fullName", "sex"]
+
+    def __init__(self, companies, people, employee_offsets, params):
+        self.companies = companies  # Dictionary field -> array of the company documents
+        self.people = people  # Dictionary field -> array of the person documents
+        self.employee_offsets = employee_offsets  # First person row of every company (plus the total at the end)
+        self.params = params  # Parameters used to generate the dataset (n, seed, ratio, company sizes, languages, engine, engine batch size)
+
+    @property
+    def n_companies(self):
+        return len(self.employee_offsets) - 1
+
+    @property
+    def n_people(self):
+        return int(self.employee_offsets[-1])
+
+    @property
+    def n(self):
+        return self.n_companies + self.n_people
+
+    @classmethod
+    def generate(cls, n, seed=None, engine=None):
+        """Generate a dataset of n documents (the same data as a single-worker data_generator run with this seed)"""
+        seed = resolve_seed(seed)
+        n_companies = n // config['generation']['person_company_ratio']  # Number of companies to generate
+        n_people = n - n_companies  # Number of people to generate
+        engine = make_engine(engine, seed=derive_seeds(seed, 1)[0])
+
+        companies = {field: [] for field in cls.COMPANY_FIELDS}
+        people = {field: [] for field in cls.PERSON_FIELDS}
+        employee_counts = []
+        for chunk_companies, chunk_people, company_indices in company_chunks(engine, n_companies, n_people):
+            for field in cls.COMPANY_FIELDS:
+                companies[field].extend(c[field] for c in chunk_companies)
+            for field in cls.PERSON_FIELDS:
+                people[field].extend(p[field] for p in chunk_people)
+            employee_counts.append(np.bincount(company_indices, minlength=len(chunk_companies)))
+
+        params = {
+            "n": n,
+            "seed": seed,
+            "person_company_ratio": config['generation']['person_company_ratio'],
+            "company_sizes": config['generation']['company_sizes'],
+            "languages": config['generation']['languages'],
+            "engine": engine.__class__.__name__,
+            "engine_batch_size": config['generation']['engine_batch_size']
+        }
+        employee_offsets = np.concatenate(([0], np.cumsum(np.concatenate(employee_counts or [[]])))).astype(np.int64)
+        return cls(
+            {field: np.array(values) for field, values in companies.items()},
+            {field: np.array(values, dtype='datetime64[D]' if field == "dateOfBirth" else None) for field, values in people.items()},
+            employee_offsets,
+            params
+        )
+
+    def save(self, path):
+        """Save the dataset in a directory with one .npy file per column (loaded back with memory mapping)"""
+        os.makedirs(path, exist_ok=True)
+        for prefix, columns in (("company", self.companies), ("person", self.people)):
+            for field, values in columns.items():
+                np.save(os.path.join(path, f"{prefix}.{field}.npy"), values)
+        np.save(os.path.join(path, "employee_offsets.npy"), self.employee_offsets)
+        with open(os.path.join(path, "params.json"), 'w') as params_file:
+            json.dump(self.params, params_file)
+
+    @classmethod
+    def load(cls, path):
+        """Load a dataset saved with save(); the columns are memory-mapped and only read when they are used"""
+        def column(prefix, field):
+            return np.load(os.path.join(path, f"{prefix}.{field}.npy"), mmap_mode='r')
+        with open(os.path.join(path, "params.json"), 'r') as params_file:
+            params = json.load(params_file)
+        return cls(
+            {field: column("company", field) for field in cls.COMPANY_FIELDS},
+            {field: column("person", field) for field in cls.PERSON_FIELDS},
+            np.load(os.path.join(path, "employee_offsets.npy")),
+            params
+        )
+
+    def chunks(self, start=0, stop=None, chunk_size=None):
+        """Project companies start:stop into (companies, people, company_indices) chunks of documents, the same
+        shape produced by pipeline.company_chunks, so every model turns them into its documents with its usual transform"""
+        stop = self.n_companies if stop is None else stop
+        chunk_size = chunk_size or max(1, config['generation']['engine_batch_size'] // config['generation']['person_company_ratio'])
+        for chunk_start in range(start, stop, chunk_size):
+            chunk_stop = min(chunk_start + chunk_size, stop)
+            first_person, last_person = int(self.employee_offsets[chunk_start]), int(self.employee_offsets[chunk_stop])
+            companies = self._documents(self.companies, chunk_start, chunk_stop)
+            people = self._documents(self.people, first_person, last_person)
+            counts = np.diff(self.employee_offsets[chunk_start:chunk_stop + 1])
+            yield companies, people, np.repeat(np.arange(chunk_stop - chunk_start), counts)
+
+    @staticmethod
+    def _documents(columns, start, stop):
+        """Build the documents of rows start:stop from the columns (one tolist() per column, then one zip)"""
+        fields = list(columns)
+        values = []
+        for field in fields:
+            column = columns[field][start:stop]
+            if column.dtype.kind == 'M':
+                column = column.astype('datetime64[us]')  # Converts to datetime.datetime objects, as required by MongoDB
+            values.append(column.tolist())
+        return [dict(zip(fields, row)) for row in zip(*values)]
@@ -0,0 +1,124 @@
+# coding=utf-8
+import hashlib
+import json
+import os
+import shutil
+import time
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from bulk_loader import BulkLoader
+
+# Load configuration
+with open('config.json', 'r') as config_file:
+    config = json.load(config_file)
+
+class DatasetCache:
+
+    """On-disk cache of loaded datasets: one directory per (model, n, ratio, languages, seed, ...) holding one
+    file of concatenated raw BSON documents per collection (the format of mongodump), so that a later run with the
+    same parameters only has to bulk-insert the cached documents. The least recently used entries are evicted
+    when the cache grows over its size limit"""
+
+    def __init__(self, directory=None, max_size_gb=None):
+        self.directory = directory or config['cache']['directory']
+        self.max_bytes = int((max_size_gb or config['cache']['max_size_gb']) * 1024 ** 3)
+
+    def key(self, model_name, n, **params):
+        """Cache key of a dataset: everything that changes the generated documents (params override the config file)"""
+        key = {
+            "model": model_name,
+            "n": n,
+            "person_company_ratio": config['generation']['person_company_ratio'],
+            "company_sizes": config['generation']['company_sizes'],
+            "languages": config['generation']['languages'],
+            "engine": config['generation']['engine'],
+            "engine_batch_size": config['generation']['engine_batch_size'],  # Size of the chunks, and so of the draws of each chunk
+            **params  # seed, workers, mode, ...
+        }
+        digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()[:12]
+        return f"{model_name}_n{n}_{digest}", key
+
+    def restore(self, db, model_name, n, **params):
+        """Drop the collections of the database and load the cached dataset. Returns False if it is not cached"""
+        entry, key = self.key(model_name, n, **params)
+        path = os.path.join(self.directory, entry)
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return False
+
+        with open(os.path.join(path, "meta.json"), 'r') as meta_file:
+            meta = json.load(meta_file)
+
+        # Same collection setup as the data generators
+        for collection_name in db.list_collection_names():
+            if not collection_name.startswith('system.'):
+                db.drop_collection(collection_name)  # Drop existing collections except system collections
+                print(f"Dropped collection: {collection_name}")
+
+        start_time = time.perf_counter()
+        for collection_name in meta["collections"]:
+            db.create_collection(collection_name)
+            loader = BulkLoader(db[collection_name])
+            for document in self._read_documents(os.path.join(path, f"{collection_name}.bson")):
+                loader.insert(document)  # Raw documents are sent as they are, without encoding them again
+            loader.close()
+        print(f"Loaded the cached dataset {entry} in {time.perf_counter() - start_time:.3f} seconds.")
+
+        self._touch(path)  # Most recently used
+        return True
+
+    def store(self, db, model_name, n, **params):
+        """Save the current collections of the database as the cached dataset, then evict old entries if needed"""
+        entry, key = self.key(model_name, n, **params)
+        path = os.path.join(self.directory, entry)
+        os.makedirs(path, exist_ok=True)
+
+        raw_options = CodecOptions(document_class=RawBSONDocument)
+        collection_names = [name for name in db.list_collection_names() if not name.startswith('system.')]
+        for collection_name in collection_names:
+            collection = db.get_collection(collection_name, codec_options=raw_options)
+            with open(os.path.join(path, f"{collection_name}.bson"), 'wb') as bson_file:
+                for document in collection.find(batch_size=config['loading']['batch_size']):
+                    bson_file.write(document.raw)
+
+        # meta.json is written last: an entry without it (e.g. an interrupted store) is never restored
+        with open(os.path.join(path, "meta.json"), 'w') as meta_file:
+            json.dump({"key": key, "collections": collection_names}, meta_file)
+        print(f"Saved the dataset in the cache ({self._size(path) / 1024 ** 2:.1f} MB in {path}).")
+
+        self._touch(path)
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        """Delete the least recently used entries until the cache is smaller than its size limit"""
+        if not os.path.isdir(self.directory):
+            return
+        entries = [os.path.join(self.directory, name) for name in os.listdir(self.directory)]
+        entries = sorted((path for path in entries if os.path.isdir(path)), key=os.path.getmtime)  # Oldest first
+        total = sum(self._size(path) for path in entries)
+        for path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            total -= self._size(path)
+            shutil.rmtree(path)
+            print(f"Evicted {os.path.basename(path)} from the dataset cache.")
+
+    @staticmethod
+    def _read_documents(path):
+        """Iterate over the raw BSON documents of a file (each document starts with its int32 length)"""
+        with open(path, 'rb') as bson_file:
+            while True:
+                header = bson_file.read(4)
+                if not header:
+                    return
+                size = int.from_bytes(header, 'little')
+                yield RawBSONDocument(header + bson_file.read(size - 4))
+
+    @staticmethod
+    def _size(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+    @staticmethod
+    def _touch(path):
+        os.utime(path)  # The modification time of the entry directory records its last use
@@ -0,0 +1,64 @@
+# coding=utf-8
+from model1 import Model1
+from model2 import Model2
+from model3 import Model3
+from model4 import Model4
+from model3_buckets import Model3Buckets
+import argparse
+import contextlib
+import io
+import json
+import time
+import numpy as np
+from connection import connect
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Load configuration file
+with open('config.json', 'r') as config_file:
+    config = json.load(config_file)
+
+MODELS = {1: Model1, 2: Model2, 3: Model3, 4: Model4, 5: Model3Buckets}
+
+def fit_growth_exponent(sizes, times):
+
+    """Empirical growth exponent k of time ~ n^k (slope of the least-squares line in log-log scale)"""
+
+    slope, intercept = np.polyfit(np.log(sizes), np.log(times), 1)
+    return slope
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Time the data generation of a model for several numbers of documents.")
+    parser.add_argument('--model', type=int, choices=sorted(MODELS), default=2, help="Model to generate (default: 2)")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help="Numbers of documents to generate")
+    parser.add_argument('--workers', type=int, default=config['generation']['workers'], help="Number of generation processes")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the data generation")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    # Connect to MongoDB from environment variable
+    client = connect()
+    db = client[config['database']['name']]
+    model = MODELS[args.model](client=client, db=db)
+
+    times = []
+    print(f"Data generation of Model {args.model}:")
+    for n in args.sizes:
+        start_time = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):  # Hide the progress messages of the generator
+            model.data_generator(n, workers=args.workers, seed=args.seed)
+        times.append(time.perf_counter() - start_time)
+        print(f"- n = {n}: {times[-1]:.3f} seconds ({times[-1] / n * 1e6:.1f} microseconds per document)")
+
+    if len(args.sizes) > 1:
+        # An exponent close to 1 means that the generation time grows linearly with n
+        print(f"Growth exponent: time ~ n^{fit_growth_exponent(args.sizes, times):.2f}")
+
+    client.close()  # Close the connection to MongoDB
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+# coding=utf-8
+import time
+
+# Name of the profile without secondary indexes (only the default _id index of every collection)
+NO_INDEXES = 'none'
+
+def drop_secondary_indexes(db):
+
+    """Drop every index of the collections of the database except the _id indexes"""
+
+    for collection_name in db.list_collection_names():
+        if not collection_name.startswith('system.'):
+            db[collection_name].drop_indexes()  # The _id index is never dropped
+
+def index_sizes(db, collection_name):
+
+    """Size in bytes of every index of a collection (from the storage statistics of the server)"""
+
+    stats = next(db[collection_name].aggregate([{"$collStats": {"storageStats": {}}}]))
+    return stats["storageStats"]["indexSizes"]
+
+def apply_index_profile(model, profile):
+
+    """Replace the secondary indexes of the model's database by the indexes of one of its profiles (model.INDEX_PROFILES).
+
+    Meant to be called after the bulk load, so the indexes are built once over the loaded data instead of being
+    updated on every insert. Returns the build time (seconds) and size (bytes) of every created index"""
+
+    if profile != NO_INDEXES and profile not in model.INDEX_PROFILES:
+        raise ValueError(f"{type(model).__name__} has no index profile '{profile}' "
+                         f"(available: {', '.join([NO_INDEXES] + list(model.INDEX_PROFILES))})")
+
+    drop_secondary_indexes(model.db)
+    if profile == NO_INDEXES:
+        return []
+
+    created = []
+    for collection_name, keys in model.INDEX_PROFILES[profile]:
+        start_time = time.perf_counter()
+        name = model.db[collection_name].create_index(keys)
+        created.append({
+            "collection": collection_name,
+            "index": name,
+            "keys": keys,
+            "build_time": time.perf_counter() - start_time
+        })
+    for index in created:
+        index["size_bytes"] = index_sizes(model.db, index["collection"]).get(index["index"])
+    return created
@@ -0,0 +1,177 @@
+# coding=utf-8
+from benchmark import MODELS, git_commit
+from connection import client_options, connect, connection_settings
+from indexes import apply_index_profile
+from parallel_generation import resolve_seed
+from queries import query_spec
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from pymongo.errors import PyMongoError
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Load configuration file
+with open('config.json', 'r') as config_file:
+    config = json.load(config_file)
+
+# Default mix of operations (relative weights): mostly point lookups, with the four queries running concurrently
+DEFAULT_MIX = {"lookup": 90, "q1": 2, "q2": 4, "q3": 2, "q4": 2}
+
+def parse_mix(items):
+
+    """Parse NAME=WEIGHT items (operations: lookup, q1, q2, q3, q4) into a dictionary of weights"""
+
+    mix = {}
+    for item in items:
+        name, _, weight = item.partition('=')
+        if name not in DEFAULT_MIX or not weight:
+            raise argparse.ArgumentTypeError(f"Invalid operation weight '{item}' (expected NAME=WEIGHT with NAME in {', '.join(DEFAULT_MIX)})")
+        mix[name] = float(weight)
+    return mix
+
+def sample_person_ids(model, size):
+
+    """IDs of up to `size` random people of the loaded model (model.PERSON_ID gives where the people are stored)"""
+
+    collection_name, field = model.PERSON_ID
+    pipeline = [{"$sample": {"size": size}}]
+    if "." in field:
+        # People embedded in an array: sample documents, then people inside them
+        pipeline += [{"$unwind": "$" + field.rsplit(".", 1)[0]}, {"$sample": {"size": size}}]
+    pipeline.append({"$project": {"_id": 0, "id": "$" + field}})
+    return [row["id"] for row in model.db[collection_name].aggregate(pipeline)]
+
+def run_operation(model, operation, person_id):
+
+    """Run one operation: reads are drained without keeping their results, updates are applied"""
+
+    if operation == "lookup":
+        return model.point_lookup_spec(person_id).stream()
+    spec = query_spec(model, int(operation[1:]))
+    return spec.stream() if spec.kind == 'read' else spec.execute()
+
+def worker(model, mix, person_ids, deadline_ns, seed):
+
+    """Run operations drawn from the mix until the deadline; returns the latencies (ns) and errors of every operation.
+    Each worker keeps its own results, so the workers never wait for each other outside of MongoDB"""
+
+    rng = np.random.default_rng(seed)
+    operations = list(mix)
+    weights = np.array([mix[operation] for operation in operations]) / sum(mix.values())
+    latencies = {operation: [] for operation in operations}
+    errors = {operation: 0 for operation in operations}
+    while time.perf_counter_ns() < deadline_ns:
+        operation = operations[rng.choice(len(operations), p=weights)]
+        person_id = person_ids[rng.integers(len(person_ids))] if person_ids else None
+        start_time = time.perf_counter_ns()
+        try:
+            run_operation(model, operation, person_id)
+        except PyMongoError:
+            errors[operation] += 1
+            continue
+        latencies[operation].append(time.perf_counter_ns() - start_time)
+    return latencies, errors
+
+def load_test(model, mix, workers, duration, person_ids, seed):
+
+    """Drive the mix of operations from `workers` threads sharing the model's client for `duration` seconds.
+    Returns the throughput (operations per second) and latency percentiles (ms) of every operation"""
+
+    if not person_ids:
+        mix = {operation: weight for operation, weight in mix.items() if operation != "lookup"}  # Nobody to look up
+    seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(workers)]
+    start_time = time.perf_counter_ns()
+    deadline_ns = start_time + int(duration * 1e9)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(worker, model, mix, person_ids, deadline_ns, worker_seed) for worker_seed in seeds]
+        outcomes = [future.result() for future in futures]
+    elapsed = (time.perf_counter_ns() - start_time) / 1e9  # Includes the last operation started before the deadline
+
+    operations = []
+    for operation in mix:
+        times_ms = np.array([t for latencies, _ in outcomes for t in latencies[operation]]) / 1e6
+        operations.append({
+            "operation": operation,
+            "count": len(times_ms),
+            "errors": sum(errors[operation] for _, errors in outcomes),
+            "throughput": len(times_ms) / elapsed,
+            "p50": float(np.percentile(times_ms, 50)) if len(times_ms) else None,
+            "p99": float(np.percentile(times_ms, 99)) if len(times_ms) else None
+        })
+    return {"elapsed": elapsed, "throughput": sum(row["count"] for row in operations) / elapsed, "operations": operations}
+
+def print_load_test(model_id, result):
+    print(f"\nModel {model_id}: {result['throughput']:.1f} operations/s in {result['elapsed']:.1f} s")
+    print(f"{'operation':<12}{'count':>9}{'errors':>8}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for row in result["operations"]:
+        p50 = f"{row['p50']:>10.2f}" if row["p50"] is not None else f"{'-':>10}"
+        p99 = f"{row['p99']:>10.2f}" if row["p99"] is not None else f"{'-':>10}"
+        print(f"{row['operation']:<12}{row['count']:>9}{row['errors']:>8}{row['throughput']:>10.1f}{p50}{p99}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test the document models with a concurrent mix of queries and point lookups.")
+    parser.add_argument('--models', type=int, nargs='+', choices=sorted(MODELS), default=sorted(MODELS), help="Models to load test")
+    parser.add_argument('--n', type=int, default=100000, help="Number of documents to generate (people and companies)")
+    parser.add_argument('--workers', type=int, default=8, help="Concurrent client threads")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds of load on every model")
+    parser.add_argument('--mix', nargs='+', default=None, metavar='NAME=WEIGHT',
+                        help="Relative weights of the operations (lookup, q1, q2, q3, q4), e.g. lookup=90 q1=5 q4=5 (default: "
+                             + " ".join(f"{name}={weight}" for name, weight in DEFAULT_MIX.items()) + ")")
+    parser.add_argument('--index-profile', default=config['loading']['index_profile'],
+                        help="Index profile (INDEX_PROFILES of the models) built after the load; models without it keep only the _id indexes")
+    parser.add_argument('--lookup-ids', type=int, default=10000, help="Number of people sampled as targets of the point lookups")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the data generation and of the operation mix")
+    parser.add_argument('--output', help="JSON file where the results are saved")
+    args = parser.parse_args()
+    args.mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+    return args
+
+def main():
+    args = parse_args()
+    args.seed = resolve_seed(args.seed)
+
+    # Connect to MongoDB from environment variable (the client is thread-safe and shared by all the workers)
+    pool_size = max(client_options()["maxPoolSize"], args.workers)  # At least one connection per worker
+    client = connect(maxPoolSize=pool_size)
+    db = client[config['database']['name']]
+
+    results = []
+    for model_id in args.models:
+        model = MODELS[model_id](client=client, db=db)
+        print(f"Loading {args.n} documents into Model {model_id}...")
+        with contextlib.redirect_stdout(io.StringIO()):  # Hide the progress messages of the generator
+            model.data_generator(args.n, seed=args.seed)
+        profile = args.index_profile if args.index_profile in model.INDEX_PROFILES else 'none'
+        apply_index_profile(model, profile)
+        person_ids = sample_person_ids(model, args.lookup_ids) if args.mix.get("lookup") else []
+
+        # Queries 3 and 4 update the data in place, so later executions find most documents already updated
+        print(f"Running the mix with {args.workers} workers for {args.duration} seconds (indexes: {profile})...")
+        result = load_test(model, args.mix, args.workers, args.duration, person_ids, args.seed)
+        print_load_test(model_id, result)
+        results.append({"model": model_id, "index_profile": profile, **result})
+
+    if args.output:
+        metadata = {
+            "commit": git_commit(),
+            "date": datetime.datetime.now().isoformat(timespec='seconds'),
+            "config": config,
+            "args": vars(args),
+            "connection": connection_settings(maxPoolSize=pool_size)
+        }
+        with open(args.output, 'w') as output_file:
+            json.dump({"metadata": metadata, "results": results}, output_file, indent=2)
+        print(f"Results saved in {args.output}.")
+
+    client.close()  # Close the connection to MongoDB
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+# coding=utf-8
+import time
+from queries import AggregateQuery
+
+class MaterializedViews:
+
+    """Materialized views of a model, written with $merge and refreshed incrementally after updates.
+
+    The views are declared by model.materialized_views(): for every view, the source collection and the pipeline
+    that computes its rows (one per _id), the pipeline that reads it as the result of a query, the fields of each
+    collection it depends on, and for each collection the pair (field of the updated documents, field of the source
+    documents) that finds the source documents whose rows must be recomputed after an update. Only insertions and
+    updates are propagated: rows of deleted documents are not removed from the views"""
+
+    KEY_BATCH_SIZE = 10000  # Keys of the rows recomputed by each refresh pipeline
+
+    def __init__(self, model):
+        self.model = model
+        self.db = model.db
+        self.views = model.materialized_views()
+
+    def build(self):
+        """Compute all the views from scratch; returns the build time (seconds) of every view"""
+        build_times = {}
+        for name, view in self.views.items():
+            start_time = time.perf_counter()
+            self.db.drop_collection(name)
+            self._merge(name, view)
+            build_times[name] = time.perf_counter() - start_time
+        return build_times
+
+    def query(self, query):
+        """Query object that reads the result of a query from its view (None if no view materializes it)"""
+        for name, view in self.views.items():
+            if view["query"] == query:
+                return AggregateQuery(self.db[name], view["read"])
+        return None
+
+    def refresh_plan(self, update):
+
+        """Views that an UpdateQuery changes, with the keys of the rows to recompute (None: the whole view). Must be
+        called before the update is applied, as an update can change the fields of its own filter: afterwards the
+        filter would match other documents (or none)"""
+
+        collection_name = update.collection.name
+        updated_paths = {_field_path(path) for operator in update.update.values() for path in operator}
+        plan = []
+        for name, view in self.views.items():
+            depends = view["depends"].get(collection_name, [])
+            if not any(_overlaps(path, field) for path in updated_paths for field in depends):
+                continue  # The update does not change any field read by the view
+            if update.filter:
+                updated_field, source_field = view["refresh_keys"][collection_name]
+                plan.append((name, source_field, self._keys(update, updated_field)))
+            else:
+                plan.append((name, None, None))  # Every document is updated: recompute the whole view
+        return plan
+
+    def refresh(self, plan):
+        """Refresh the views of a refresh plan (taken before the update): only the rows computed from the updated
+        documents. Returns the names of the refreshed views"""
+        for name, source_field, keys in plan:
+            view = self.views[name]
+            if keys is None:
+                self._merge(name, view)
+                continue
+            # Batches of keys, so the $in of the $match never makes the aggregate command too large
+            for start in range(0, len(keys), self.KEY_BATCH_SIZE):
+                self._merge(name, view, [{"$match": {source_field: {"$in": keys[start:start + self.KEY_BATCH_SIZE]}}}])
+        return [name for name, _, _ in plan]
+
+    @staticmethod
+    def _keys(update, field):
+        """Distinct values of a field in the documents matched by the filter of an update, read from an aggregation
+        cursor (unlike distinct, whose result is a single document, there is no 16 MB limit on the number of keys)"""
+        pipeline = [
+            {"$match": {"$and": [update.filter, {field: {"$exists": True}}]}},
+            {"$group": {"_id": "$" + field}}
+        ]
+        return [row["_id"] for row in update.collection.aggregate(pipeline)]
+
+    def _merge(self, name, view, match=None):
+        """Run the pipeline of a view (restricted by a leading $match) and upsert its rows into the view"""
+        pipeline = (match or []) + view["pipeline"] + [
+            {"$merge": {"into": name, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+        ]
+        self.db[view["source"]].aggregate(pipeline)
+
+class RefreshedUpdate:
+
+    """Write query followed by the incremental refresh of the materialized views that it changes"""
+
+    kind = 'write'
+
+    def __init__(self, update, views):
+        self.update = update
+        self.views = views
+
+    def execute(self):
+        """Apply the update, then refresh the views; returns the UpdateResult (a list of them for an UpdateSequence)"""
+        results = []
+        for update in getattr(self.update, 'updates', [self.update]):  # Every update of an UpdateSequence, in order
+            plan = self.views.refresh_plan(update)  # Keys of the rows to refresh, matched before the update changes them
+            results.append(update.execute())
+            self.views.refresh(plan)
+        return results if hasattr(self.update, 'updates') else results[0]
+
+    def explain(self):
+        """Explain of the update (the refresh pipelines are not included)"""
+        return self.update.explain()
+
+def _field_path(path):
+
+    """Field of an update path without the positional operators: employees.$[elem].age -> employees.age"""
+
+    return ".".join(part for part in path.split(".") if not (part.startswith("$") or part.isdigit()))
+
+def _overlaps(path, field):
+
+    """An updated path changes a field if they are the same field or one contains the other"""
+
+    return path == field or field.startswith(path + ".") or path.startswith(field + ".")
@@ -2,8 +2,9 @@
 import datetime
 import time
 import json
-from faker import Faker
-import re
+from pipeline import GenerationPipeline, company_chunks
+from queries import AggregateQuery, UpdateQuery
+from parallel_generation import resolve_seed, split_companies, run_shards
 
 # Load configuration
 with open('config.json', 'r') as config_file:
@@ -11,11 +12,43 @@ with open('config.json', 'r') as config_file:
 
 class Model2:
 
+    # Secondary indexes that can be created after the bulk load: profile name -> [(collection, keys)]
+    INDEX_PROFILES = {
+        "person_company": [("Person", [("company._id", 1)])],  # Ranges of companies of the partitioned Query 2 and refresh of its view
+        "person_birth": [("Person", [("dateOfBirth", 1)])]  # Date of birth filter of Query 3
+    }
+
+    # Optimized variants of the queries, timed and checked against the baseline: query -> {variant name: method}
+    QUERY_VARIANTS = {
+        3: {"range": "query_3_range_spec"}
+    }
+
+    # Field used to split the Person collection into ranges for parallel reads (default _id): query -> field.
+    # Query 2 groups the people by company, so all the employees of a company must be in the same range
+    PARTITION_FIELDS = {
+        2: "company._id"
+    }
+
+    # Documents of the loaded data (checked before running the queries on existing data):
+    # collection -> (each counted document is a "person" or a "company", filter of the counted documents, fields of every document)
+    DOCUMENTS = {
+        "Person": ("person", {}, ["fullName", "dateOfBirth", "company._id", "company.name"])
+    }
+
+    # Collection and field that identify a person (people are sampled from it for point lookups)
+    PERSON_ID = ("Person", "_id")
+
     def __init__(self, client, db):
         self.client = client
         self.db = db
 
-    def data_generator(self, n):
+    def data_generator(self, n, workers=None, seed=None, dataset=None):
+
+        """Generate n documents (people with their company embedded), splitting the companies and their employees across `workers` processes.
+        If a canonical `dataset` is given, its data is written instead (n is then taken from the dataset)"""
+
+        workers = workers or config['generation']['workers']  # Number of worker processes (with a default value from the config file)
+        seed = resolve_seed(seed)  # The same seed and number of workers always generate the same data
         
         # 1. Collection Setup
 
@@ -26,92 +59,80 @@ class Model2:
                 print(f"Dropped collection: {collection_name}")
 
         # Create only the Person collection
-        collection_objects = {'Person': self.db.create_collection('Person')}
+        self.db.create_collection('Person')
         
         # 2. Data Generation
 
-        fake = Faker(config['generation']['languages'])  # Create a Faker object with multiple languages
+        if dataset is not None:
+            # Project the canonical dataset into Model 2 documents (only the writes are left to do)
+            self._pipeline().run(dataset.chunks())
+            print(f"Loaded {dataset.n_people} people from the dataset, embedding {dataset.n_companies} companies.")
+            print(f"Total: {dataset.n_people} documents.")
+            print("Data generation completed successfully.")
+            return
         
         person_company_ratio = config['generation']['person_company_ratio']  # Ratio of people to companies (with a default value)
         n_companies = n // person_company_ratio  # Number of companies to generate
         n_people = n - n_companies  # Number of people to generate
-        
-        # Generate companies first and keep track of their IDs
-        company_list = []  # List to store company data for later use
-        company_ids = []
-        company_domains = {}  # Dictionary to store company domains for later use
-        for x in range(n_companies):  # Generate n_companies documents
-            
-            # Generate random data with consistency
-            c_name = fake.company()
-            c_domain = "@" + re.sub(r'[^\w]', '', c_name).lower() + ".com"
-            c_email = 'customers' + c_domain
-            c_url = c_name.replace(" ", "").lower() + ".com"
-            
-            # Create custom company IDs (not MongoDB default ObjectId)
-            company_id = fake.uuid4()
-            
-            c = {
-                "_id": company_id,
-                "domain": c_domain,
-                "email": c_email,
-                "name": c_name, 
-                "url": c_url, 
-                "vatNumber": fake.uuid4()
-            }
-            
-            company_list.append(c)  # Store the company data
-            company_domains[company_id] = c_domain
-            company_ids.append(company_id)  # Store company ID for later use
-                    
-        print(f"Generated {n_companies} companies with {len(company_ids)} unique IDs.")
-
-        # Now generate people and assign each to a company
-        for x in range(n_people):  # Generate n_people documents
-            
-            # Generate random data with consistency
-            person_id = fake.uuid4()
-            date_of_birth = fake.date_of_birth(minimum_age=18, maximum_age=80)
-            date_of_birth_dt = datetime.datetime.combine(date_of_birth, datetime.time.min)  # Convert date_of_birth to datetime.datetime object to ensure compatibility with MongoDB
-            age = datetime.datetime.now().year - date_of_birth.year
-            first_name = fake.first_name()
-            last_name = fake.last_name()
-            full_name = first_name + " " + last_name
-            email = first_name.lower() + '.' + last_name.lower() + '@' + 'example.com'
-            
-            # Assign person to a random company
-            assigned_company_id = fake.random_element(elements=company_ids)
-            company_domain = company_domains[assigned_company_id]
-
-			# Create custom company email from the company name
-            company_email = first_name.lower() + '.' + last_name.lower() + company_domain
-            
-            p = {
-                "_id": person_id,
-                "age": age,
-                "companyEmail": company_email,
-                "dateOfBirth": date_of_birth_dt,
-                "email": email,
-                "firstName": first_name,
-                "fullName": full_name,
-                "sex": fake.random_element(elements=('M', 'F', 'O'))
-            }
 
-            # Append the company dictionary corresponding to the assigned company ID
-            # to the person dictionary
-            company = next((c for c in company_list if c['_id'] == assigned_company_id), None)
-            p["company"] = company
-            
-            collection_objects['Person'].insert_one(p)  # Insert the generated data into the collection
+        # Companies are generated in chunks together with all of their employees and streamed to MongoDB, so no
+        # global list of companies is kept. Every worker generates and writes its own range of companies
+        shard_args = split_companies(n_companies, n_people, workers, seed)
+        run_shards(self, '_generate_shard', shard_args, seed)
         
-        print(f"Generated {n_people} people.")
+        print(f"Generated {n_companies} companies and {n_people} people with {workers} worker(s).")
         print(f"Total: {n_people} documents.")
         print("Data generation completed successfully.")
 
-    def query_1(self):
+    def _generate_shard(self, engine, n_companies, n_people, sizes=None):
+
+        """Generate and write the n_people employees of n_companies companies through the streaming pipeline"""
+
+        return self._pipeline().run(company_chunks(engine, n_companies, n_people, sizes=sizes))
+
+    def _pipeline(self):
+
+        """Streaming pipeline that writes chunks of companies and employees as Model 2 documents"""
+
+        return GenerationPipeline(self.db, self._to_documents)
+
+    def _to_documents(self, companies, people, company_indices):
+
+        """Transform a chunk of companies and their employees into Model 2 documents"""
+
+        for company_index, p in zip(company_indices.tolist(), people):
+            p["company"] = companies[company_index]  # Embed the assigned company in the person dictionary
+        return {"Person": people}
+
+    def materialized_views(self):
+
+        """Materialized views of Query 1 and Query 2 (maintained by materialized_views.MaterializedViews)"""
+
+        return {
+            "PersonCompanyView": {
+                "query": 1,
+                "source": "Person",
+                "pipeline": [{"$project": {"fullName": "$fullName", "companyName": "$company.name", "companyId": "$company._id"}}],
+                "read": [{"$project": {"fullName": 1, "companyName": 1}}],  # Same rows as query_1
+                "depends": {"Person": ["fullName", "company._id", "company.name"]},
+                "refresh_keys": {"Person": ("_id", "_id")}
+            },
+            "CompanyEmployeeCount": {
+                "query": 2,
+                "source": "Person",
+                "pipeline": [
+                    {"$group": {"_id": "$company._id", "companyName": {"$first": "$company.name"}, "numEmployees": {"$sum": 1}}}
+                ],
+                "read": [],  # Same rows as query_2
+                "depends": {"Person": ["company._id", "company.name"]},
+                "refresh_keys": {"Person": ("company._id", "company._id")}  # Updated person -> all the employees of its company
+            }
+        }
+
+    def query_1_spec(self):
+
+        """Query 1 to be executed (collection and operation): for each person, retrieve full name and their company's name"""
 
-        """For each person, retrieve full name and their company's name"""
-    
         # Get the Person collection
         person_collection = self.db['Person']
         
@@ -124,26 +145,32 @@ class Model2:
                 }
             }
         ]
-        
+
+        return AggregateQuery(person_collection, pipeline)
+
+    def query_1(self):
+
+        """For each person, retrieve full name and their company's name"""
+
         # Execute the aggregation query
         start_time = time.time()
-        results = list(person_collection.aggregate(pipeline))
+        results = self.query_1_spec().stream(sample=5)  # Counts the results, keeping only the first 5
         query_time = time.time() - start_time
 
         # Display length of results
         print("\n", "--" * 30)
         print(f"\nQuery 1 executed in {query_time} seconds.")
-        print(f"Found {len(results)} people with their companies. First 5 results:")
+        print(f"Found {results.rows} people with their companies. First 5 results:")
         
-        for result in results[:5]:  # Display only the first 5 results
+        for result in results.sample:  # Display only the first 5 results
             print(f"- {result['fullName']} works at {result['companyName']}")
         
         return query_time
     
-    def query_2(self):
+    def query_2_spec(self):
+
+        """Query 2 to be executed (collection and operation): for each company, retrieve its name and the number of employees"""
 
-        """For each company, retrieve its name and the number of employees"""
-        
         # Get the Person collection (since companies are embedded in Person)
         person_collection = self.db['Person']
         
@@ -157,32 +184,37 @@ class Model2:
                 }
             }
         ]
-        
+
+        return AggregateQuery(person_collection, pipeline)
+
+    def query_2(self):
+
+        """For each company, retrieve its name and the number of employees"""
+
         # Execute the aggregation query
         start_time = time.time()
-        results = list(person_collection.aggregate(pipeline))
+        results = self.query_2_spec().stream(sample=5)  # Counts the results, keeping only the first 5
         query_time = time.time() - start_time
 
         # Display length of results
         print("\n", "--" * 30)
         print(f"\nQuery 2 executed in {query_time} seconds.")
-        print(f"Found {len(results)} companies. First 5 results:")
+        print(f"Found {results.rows} companies. First 5 results:")
         
-        for result in results[:5]:  # Display only the first 5 results
+        for result in results.sample:  # Display only the first 5 results
             print(f"- {result['companyName']} has {result['numEmployees']} employees")
         
         return query_time
 
-    def query_3(self):
+    def query_3_spec(self):
 
-        """For each person born before 1988, update their age to “30”"""
+        """Query 3 to be executed (collection and operation): for each person born before 1988, update their age to “30”"""
 
         # Get the Person collection
         person_collection = self.db['Person']
-        
-        # Execute the update query
-        start_time = time.time()
-        results = person_collection.update_many(
+
+        return UpdateQuery(
+            person_collection,
             filter = {
                 "$expr": {  # Allows us to use aggregation expressions (like $year) in the query
                     "$lt": [{"$year": "$dateOfBirth"}, 1988]  # Compute year of birth and compare it
@@ -190,6 +222,14 @@ class Model2:
             },
             update = {"$set": {"age": 30}}
         )
+
+    def query_3(self):
+
+        """For each person born before 1988, update their age to “30”"""
+
+        # Execute the update query
+        start_time = time.time()
+        results = self.query_3_spec().execute()
         query_time = time.time() - start_time
         
         # Display the number of documents updated
@@ -199,19 +239,39 @@ class Model2:
 
         return query_time
 
-    def query_4(self):
+    def query_3_range_spec(self):
 
-        """For each company, update its name to include the word “Company”"""
+        """Query 3 with a range predicate on the date of birth: same people as $year < 1988, but it can use an index on dateOfBirth"""
+
+        # Get the Person collection
+        person_collection = self.db['Person']
+
+        return UpdateQuery(
+            person_collection,
+            filter = {"dateOfBirth": {"$lt": datetime.datetime(1988, 1, 1)}},  # Born before 1988 <=> born before January 1st, 1988
+            update = {"$set": {"age": 30}}
+        )
+
+    def query_4_spec(self):
+
+        """Query 4 to be executed (collection and operation): for each company, update its name to include the word “Company”"""
 
         # Get the Person collection (since companies are embedded in Person)
         person_collection = self.db['Person']
 
-        # Execute the update query
-        start_time = time.time()
-        results = person_collection.update_many(
+        return UpdateQuery(
+            person_collection,
             filter = {},  # No filter, update all companies
             update = {"$set": {"company.name": "Company"}}
         )
+
+    def query_4(self):
+
+        """For each company, update its name to include the word “Company”"""
+
+        # Execute the update query
+        start_time = time.time()
+        results = self.query_4_spec().execute()
         query_time = time.time() - start_time
         
         # Display the number of documents updated
@@ -219,4 +279,16 @@ class Model2:
         print(f"\nQuery 4 executed in {query_time} seconds.")
         print(f"Matched {results.matched_count} documents and updated company names of {results.modified_count} documents to have the name 'Company'.")
 
-        return query_time
\ No newline at end of file
+        return query_time
+
+    def point_lookup_spec(self, person_id):
+
+        """Point lookup to be executed (collection and operation): full name and company name of one person"""
+
+        # Get the Person collection
+        person_collection = self.db['Person']
+
+        # Same pipeline as Query 1, for one person found with the _id index
+        pipeline = [{"$match": {"_id": person_id}}] + self.query_1_spec().pipeline
+
+        return AggregateQuery(person_collection, pipeline)
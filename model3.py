@@ -2,8 +2,10 @@
 import datetime
 import time
 import json
-from faker import Faker
-import re
+from pymongo import UpdateOne
+from pipeline import GenerationPipeline, company_chunks
+from queries import AggregateQuery, UpdateQuery
+from parallel_generation import resolve_seed, split_companies, run_shards
 
 # Load configuration
 with open('config.json', 'r') as config_file:
@@ -11,11 +13,43 @@ with open('config.json', 'r') as config_file:
 
 class Model3:
 
+    # Secondary indexes that can be created after the bulk load: profile name -> [(collection, keys)]
+    INDEX_PROFILES = {
+        "employee_birth": [("Company", [("employees.dateOfBirth", 1)])],  # Multikey index on the dates of birth of Query 3
+        "employee_id": [("Company", [("employees._id", 1)])]  # Company of an employee (point lookups)
+    }
+
+    # Optimized variants of the queries, timed and checked against the baseline: query -> {variant name: method}
+    QUERY_VARIANTS = {
+        3: {"range": "query_3_range_spec"}
+    }
+
+    # Documents of the loaded data (checked before running the queries on existing data):
+    # collection -> (each counted document is a "person" or a "company", filter of the counted documents, fields of every document)
+    DOCUMENTS = {
+        "Company": ("company", {"bucket": {"$exists": False}}, ["name", "employees"])  # Not the buckets of Model3Buckets
+    }
+
+    # Collection and field that identify a person (people are sampled from it for point lookups)
+    PERSON_ID = ("Company", "employees._id")
+
     def __init__(self, client, db):
         self.client = client
         self.db = db
 
-    def data_generator(self, n):
+    def data_generator(self, n, mode=None, workers=None, seed=None, dataset=None, person_company_ratio=None):
+
+        """Generate n documents (companies and people). In "assemble" mode every company is written once with
+        its complete employees array; in "push" mode companies are inserted empty and each person is added with $push.
+        The companies and their employees are split across `workers` processes. The number of companies is
+        n / person_company_ratio (default: config file). If a canonical `dataset` is given, its data is written
+        instead (n is then taken from the dataset)"""
+
+        mode = mode or config['generation']['model3_mode']  # Generation mode (with a default value from the config file)
+        if mode not in ('assemble', 'push'):
+            raise ValueError(f"Unknown Model 3 generation mode: {mode}")
+        workers = workers or config['generation']['workers']  # Number of worker processes (with a default value from the config file)
+        seed = resolve_seed(seed)  # The same seed and number of workers always generate the same data
         
         # 1. Collection Setup
 
@@ -26,95 +60,108 @@ class Model3:
                 print(f"Dropped collection: {collection_name}")
 
         # Create only the Company collection
-        collection_objects = {'Company': self.db.create_collection('Company')}
+        self.db.create_collection('Company')
         
         # 2. Data Generation
 
-        fake = Faker(config['generation']['languages'])  # Create a Faker object with multiple languages
+        if dataset is not None:
+            # Project the canonical dataset into Model 3 documents (only the writes are left to do)
+            self._pipeline(mode).run(dataset.chunks())
+            print(f"Loaded {dataset.n_companies} companies with {dataset.n_people} employees from the dataset.")
+            print(f"Total: {self.db['Company'].estimated_document_count()} documents.")  # More than the companies with buckets
+            print("Data generation completed successfully.")
+            return
         
-        person_company_ratio = config['generation']['person_company_ratio']  # Ratio of people to companies (with a default value)
+        person_company_ratio = person_company_ratio or config['generation']['person_company_ratio']  # Ratio of people to companies (with a default value)
         n_companies = n // person_company_ratio  # Number of companies to generate
         n_people = n - n_companies  # Number of people to generate
-        
-        # Generate companies first and keep track of their IDs
-        company_ids = []
-        company_domains = {}  # Dictionary to store company domains for later use
-        for x in range(n_companies):  # Generate n_companies documents
-            
-            # Generate random data with consistency
-            c_name = fake.company()
-            c_domain = "@" + re.sub(r'[^\w]', '', c_name).lower() + ".com"
-            c_email = 'customers' + c_domain
-            c_url = c_name.replace(" ", "").lower() + ".com"
-            
-            # Create custom company IDs (not MongoDB default ObjectId)
-            company_id = fake.uuid4()
-            
-            c = {
-                "_id": company_id,
-                "domain": c_domain,
-                "email": c_email,
-                "name": c_name, 
-                "url": c_url, 
-                "vatNumber": fake.uuid4(),
-                "employees": []  # Initialize empty array to store employees as embedded documents
-            }
-            
-            company_domains[company_id] = c_domain
-            company_ids.append(company_id)  # Store company ID for later use
-            
-            collection_objects['Company'].insert_one(c)  # Insert the generated data into the collection
-        
-        print(f"Generated {n_companies} companies with {len(company_ids)} unique IDs.")
-
-        # Now generate people and assign each to a company
-        companies_to_employees = {company_id: [] for company_id in company_ids}
-        for x in range(n_people):  # Generate n_people documents
-            
-            # Generate random data with consistency
-            person_id = fake.uuid4()
-            date_of_birth = fake.date_of_birth(minimum_age=18, maximum_age=80)
-            date_of_birth_dt = datetime.datetime.combine(date_of_birth, datetime.time.min)  # Convert date_of_birth to datetime.datetime object to ensure compatibility with MongoDB
-            age = datetime.datetime.now().year - date_of_birth.year
-            first_name = fake.first_name()
-            last_name = fake.last_name()
-            full_name = first_name + " " + last_name
-            email = first_name.lower() + '.' + last_name.lower() + '@' + 'example.com'
-            
-            # Assign person to a random company
-            assigned_company_id = fake.random_element(elements=company_ids)
-            company_domain = company_domains[assigned_company_id]
-
-			# Create custom company email from the company name
-            company_email = first_name.lower() + '.' + last_name.lower() + company_domain
-            
-            p = {
-                "_id": person_id,
-                "age": age,
-                "companyEmail": company_email,
-                "dateOfBirth": date_of_birth_dt,
-                "email": email,
-                "firstName": first_name,
-                "fullName": full_name,
-                "sex": fake.random_element(elements=('M', 'F', 'O')),
-            }
-            
-            companies_to_employees[assigned_company_id].append(person_id)  # Track this person for the company's employee list
-            # Append the person dictionary to the employees array of the assigned company
-            collection_objects['Company'].update_one(
-                {"_id": assigned_company_id},  # Filter document (company ID)
+
+        # Companies are generated in chunks together with all of their employees and streamed to MongoDB, so no
+        # global list of companies or people is kept. Every worker generates and writes its own range of companies
+        shard_args = [(mode, *shard, person_company_ratio) for shard in split_companies(n_companies, n_people, workers, seed)]
+        run_shards(self, '_generate_shard', shard_args, seed)
+
+        if mode == 'push':
+            print("Updated all companies with employee references.")
+        print(f"Generated {n_companies} companies and {n_people} people with {workers} worker(s).")
+        print(f"Total: {self.db['Company'].estimated_document_count()} documents.")  # More than the companies with buckets
+        print("Data generation completed successfully.")
+
+    def _generate_shard(self, engine, mode, n_companies, n_people, sizes=None, person_company_ratio=None):
+
+        """Generate and write n_companies companies and their n_people employees through the streaming pipeline"""
+
+        chunks = company_chunks(engine, n_companies, n_people, sizes=sizes, person_company_ratio=person_company_ratio)
+        return self._pipeline(mode, person_company_ratio).run(chunks)
+
+    def _pipeline(self, mode=None, person_company_ratio=None):
+
+        """Streaming pipeline that writes chunks of companies and employees in the given generation mode (default: config file)"""
+
+        mode = mode or config['generation']['model3_mode']
+        if mode == 'assemble':
+            # Finished companies are written in batches holding about batch_size embedded employees
+            person_company_ratio = person_company_ratio or config['generation']['person_company_ratio']
+            batch_size = max(1, config['loading']['batch_size'] // person_company_ratio)
+            return GenerationPipeline(self.db, self._assemble_companies, batch_sizes={'Company': batch_size})
+        return GenerationPipeline(self.db, self._push_employees)
+
+    def _assemble_companies(self, companies, people, company_indices):
+
+        """Build each company's complete employees array client-side, so that every finished company is inserted once"""
+
+        for c in companies:
+            c["employees"] = []  # Array to store employees as embedded documents
+        for company_index, p in zip(company_indices.tolist(), people):
+            companies[company_index]["employees"].append(p)
+        return {"Company": companies}
+
+    def _push_employees(self, companies, people, company_indices):
+
+        """Insert the companies with an empty employees array and add each person to its company with a $push update
+        (the loader always sends the buffered inserts before the buffered updates)"""
+
+        for c in companies:
+            c["employees"] = []  # Initialize empty array to store employees as embedded documents
+        pushes = [
+            UpdateOne(
+                {"_id": companies[company_index]["_id"]},  # Filter document (company ID)
                 {"$push": {"employees": p}}  # Push the person dictionary into the employees array
             )
+            for company_index, p in zip(company_indices.tolist(), people)
+        ]
+        return {"Company": companies + pushes}
 
-        print(f"Generated {n_people} people.")
-        print("Updated all companies with employee references.")
-        print(f"Total: {n_companies} documents.")
-        print("Data generation completed successfully.")
+    def materialized_views(self):
 
-    def query_1(self):
+        """Materialized views of Query 1 and Query 2 (maintained by materialized_views.MaterializedViews)"""
+
+        return {
+            "PersonCompanyView": {
+                "query": 1,
+                "source": "Company",
+                "pipeline": [
+                    {"$unwind": "$employees"},
+                    {"$project": {"_id": "$employees._id", "fullName": "$employees.fullName", "companyName": "$name", "companyId": "$_id"}}
+                ],
+                "read": [{"$project": {"_id": "$companyId", "fullName": 1, "companyName": 1}}],  # Same rows as query_1
+                "depends": {"Company": ["name", "employees._id", "employees.fullName"]},
+                "refresh_keys": {"Company": ("_id", "_id")}
+            },
+            "CompanyEmployeeCount": {
+                "query": 2,
+                "source": "Company",
+                "pipeline": [{"$project": {"companyName": "$name", "numEmployees": {"$size": "$employees"}}}],
+                "read": [],  # Same rows as query_2
+                "depends": {"Company": ["name", "employees._id"]},  # The number of employees changes with the set of _id
+                "refresh_keys": {"Company": ("_id", "_id")}
+            }
+        }
+
+    def query_1_spec(self):
+
+        """Query 1 to be executed (collection and operation): for each person, retrieve full name and their company's name"""
 
-        """For each person, retrieve full name and their company's name"""
-    
         # Get the Company collection (since employees are embedded in Company documents)
         company_collection = self.db['Company']
         
@@ -130,26 +177,32 @@ class Model3:
                 }
             }
         ]
-        
+
+        return AggregateQuery(company_collection, pipeline)
+
+    def query_1(self):
+
+        """For each person, retrieve full name and their company's name"""
+
         # Execute the aggregation query
         start_time = time.time()
-        results = list(company_collection.aggregate(pipeline))
+        results = self.query_1_spec().stream(sample=5)  # Counts the results, keeping only the first 5
         query_time = time.time() - start_time
 
         # Display length of results
         print("\n", "--" * 30)
         print(f"\nQuery 1 executed in {query_time} seconds.")
-        print(f"Found {len(results)} people with their companies. First 5 results:")
+        print(f"Found {results.rows} people with their companies. First 5 results:")
         
-        for result in results[:5]:  # Display only the first 5 results
+        for result in results.sample:  # Display only the first 5 results
             print(f"- {result['fullName']} works at {result['companyName']}")
         
         return query_time
     
-    def query_2(self):
+    def query_2_spec(self):
+
+        """Query 2 to be executed (collection and operation): for each company, retrieve its name and the number of employees"""
 
-        """For each company, retrieve its name and the number of employees"""
-        
         # Get the Company collection
         company_collection = self.db['Company']
         
@@ -162,38 +215,51 @@ class Model3:
                 }
             }
         ]
-        
+
+        return AggregateQuery(company_collection, pipeline)
+
+    def query_2(self):
+
+        """For each company, retrieve its name and the number of employees"""
+
         # Execute the aggregation query
         start_time = time.time()
-        results = list(company_collection.aggregate(pipeline))
+        results = self.query_2_spec().stream(sample=5)  # Counts the results, keeping only the first 5
         query_time = time.time() - start_time
 
         # Display length of results
         print("\n", "--" * 30)
         print(f"\nQuery 2 executed in {query_time} seconds.")
-        print(f"Found {len(results)} companies. First 5 results:")
+        print(f"Found {results.rows} companies. First 5 results:")
         
-        for result in results[:5]:  # Display only the first 5 results
+        for result in results.sample:  # Display only the first 5 results
             print(f"- {result['companyName']} has {result['numEmployees']} employees")
         
         return query_time
 
-    def query_3(self):
+    def query_3_spec(self):
 
-        """For each person born before 1988, update their age to “30”"""
+        """Query 3 to be executed (collection and operation): for each person born before 1988, update their age to “30”"""
 
         # Get the Person collection
         company_collection = self.db['Company']
-        
-        # Execute the update query
-        start_time = time.time()
-        results = company_collection.update_many(
+
+        return UpdateQuery(
+            company_collection,
             filter = { "employees": { "$exists": True } },  # (Filter) Check that the "employees" array exists
             update = { "$set": { "employees.$[elem].age": 30 } },  # (Update) age to 30, considering the array filter
             array_filters = [
-                { "elem.dateOfBirth": { "$lt": datetime.datetime(1988, 1, 1)} }  # For each element of the array, update if DOB less than 1998 (workaround, as $expression does not work with arrayFilters)
+                { "elem.dateOfBirth": { "$lt": datetime.datetime(1988, 1, 1)} }  # For each element of the array, update if DOB less than 1988 (workaround, as $expression does not work with arrayFilters)
             ]
         )
+
+    def query_3(self):
+
+        """For each person born before 1988, update their age to “30”"""
+
+        # Execute the update query
+        start_time = time.time()
+        results = self.query_3_spec().execute()
         query_time = time.time() - start_time
         
         # Display the number of documents updated
@@ -203,19 +269,43 @@ class Model3:
 
         return query_time
 
-    def query_4(self):
+    def query_3_range_spec(self):
 
-        """For each company, update its name to include the word “Company”"""
+        """Query 3 that only matches the companies with an employee born before 1988 (which can use an index on
+        employees.dateOfBirth) instead of every company with an employees array"""
 
         # Get the Company collection
         company_collection = self.db['Company']
 
-        # Execute the update query
-        start_time = time.time()
-        results = company_collection.update_many(
+        return UpdateQuery(
+            company_collection,
+            filter = { "employees.dateOfBirth": { "$lt": datetime.datetime(1988, 1, 1) } },  # (Filter) At least one employee born before 1988
+            update = { "$set": { "employees.$[elem].age": 30 } },  # (Update) age to 30, considering the array filter
+            array_filters = [
+                { "elem.dateOfBirth": { "$lt": datetime.datetime(1988, 1, 1)} }  # For each element of the array, update if DOB less than 1988
+            ]
+        )
+
+    def query_4_spec(self):
+
+        """Query 4 to be executed (collection and operation): for each company, update its name to include the word “Company”"""
+
+        # Get the Company collection
+        company_collection = self.db['Company']
+
+        return UpdateQuery(
+            company_collection,
             filter = {},  # No filter, update all companies
             update = {"$set": {"name": "Company"}}
         )
+
+    def query_4(self):
+
+        """For each company, update its name to include the word “Company”"""
+
+        # Execute the update query
+        start_time = time.time()
+        results = self.query_4_spec().execute()
         query_time = time.time() - start_time
         
         # Display the number of documents updated
@@ -223,4 +313,20 @@ class Model3:
         print(f"\nQuery 4 executed in {query_time} seconds.")
         print(f"Matched {results.matched_count} companies and updated {results.modified_count} companies to have the name 'Company'.")
 
-        return query_time
\ No newline at end of file
+        return query_time
+
+    def point_lookup_spec(self, person_id):
+
+        """Point lookup to be executed (collection and operation): full name and company name of one person"""
+
+        # Get the Company collection (since employees are embedded in Company documents)
+        company_collection = self.db['Company']
+
+        # Find the company of the person (with the employee_id index, a full scan otherwise), then keep only that employee
+        pipeline = [
+            {"$match": {"employees._id": person_id}},
+            {"$unwind": "$employees"},
+            {"$match": {"employees._id": person_id}}
+        ] + self.query_1_spec().pipeline[1:]
+
+        return AggregateQuery(company_collection, pipeline)
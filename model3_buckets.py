@@ -0,0 +1,139 @@
+# coding=utf-8
+import json
+from pipeline import GenerationPipeline
+from queries import AggregateQuery
+from model3 import Model3
+
+# Load configuration
+with open('config.json', 'r') as config_file:
+    config = json.load(config_file)
+
+class Model3Buckets(Model3):
+
+    """Model 3 with the bucket pattern: the employees of a company are split into bucket documents of at most
+    `bucket_size` employees (generation.bucket_size in the config file), so company documents stay far from the
+    16 MB limit and every employees array is short. Each bucket keeps the company ID, its position, the company
+    name (read by Query 1 and renamed by Query 4) and the number of employees it holds; the other company fields
+    are only stored in the first bucket. Every company has at least one bucket, even without employees.
+    Query 3 and Query 4 are the Model 3 updates, which apply to every bucket"""
+
+    # Secondary indexes that can be created after the bulk load: profile name -> [(collection, keys)]
+    INDEX_PROFILES = {
+        "employee_birth": [("Company", [("employees.dateOfBirth", 1)])],  # Multikey index on the dates of birth of Query 3
+        "bucket_company": [("Company", [("companyId", 1), ("bucket", 1)])],  # Buckets of a company, in order
+        "employee_id": [("Company", [("employees._id", 1)])]  # Bucket of an employee (point lookups)
+    }
+
+    # Documents of the loaded data (checked before running the queries on existing data):
+    # collection -> (each counted document is a "person" or a "company", filter of the counted documents, fields of every document)
+    DOCUMENTS = {
+        "Company": ("company", {"bucket": 0}, ["companyId", "bucket", "name", "count", "employees"])  # First bucket of each company
+    }
+
+    # Query 2 groups the buckets by company, so all the buckets of a company must be in the same range
+    PARTITION_FIELDS = {
+        2: "companyId"
+    }
+
+    def _pipeline(self, mode=None, person_company_ratio=None):
+
+        """Streaming pipeline that writes chunks of companies and employees as buckets (their batch size depends on
+        the bucket size, not on person_company_ratio)"""
+
+        mode = mode or config['generation']['model3_mode']
+        if mode != 'assemble':
+            raise ValueError("The buckets of Model 3 are always assembled client-side")
+        # Finished buckets are written in batches holding about batch_size embedded employees
+        batch_size = max(1, config['loading']['batch_size'] // config['generation']['bucket_size'])
+        return GenerationPipeline(self.db, self._assemble_buckets, batch_sizes={'Company': batch_size})
+
+    def _assemble_buckets(self, companies, people, company_indices):
+
+        """Split each company's employees into buckets of at most bucket_size employees"""
+
+        bucket_size = config['generation']['bucket_size']
+        employees = [[] for _ in companies]
+        for company_index, p in zip(company_indices.tolist(), people):
+            employees[company_index].append(p)
+
+        buckets = []
+        for c, company_employees in zip(companies, employees):
+            for k, start in enumerate(range(0, max(len(company_employees), 1), bucket_size)):
+                bucket = {"_id": f"{c['_id']}-{k}", "companyId": c["_id"], "bucket": k}
+                if k == 0:
+                    bucket.update((field, value) for field, value in c.items() if field != "_id")  # Company fields
+                else:
+                    bucket["name"] = c["name"]
+                bucket["count"] = len(company_employees[start:start + bucket_size])  # Employees in this bucket
+                bucket["employees"] = company_employees[start:start + bucket_size]
+                buckets.append(bucket)
+        return {"Company": buckets}
+
+    def materialized_views(self):
+
+        """Materialized views of Query 1 and Query 2 (maintained by materialized_views.MaterializedViews)"""
+
+        return {
+            "PersonCompanyView": {
+                "query": 1,
+                "source": "Company",
+                "pipeline": [
+                    {"$unwind": "$employees"},
+                    {"$project": {"_id": "$employees._id", "fullName": "$employees.fullName", "companyName": "$name", "companyId": "$companyId"}}
+                ],
+                "read": [{"$project": {"_id": "$companyId", "fullName": 1, "companyName": 1}}],  # Same rows as query_1
+                "depends": {"Company": ["name", "employees._id", "employees.fullName"]},
+                "refresh_keys": {"Company": ("_id", "_id")}
+            },
+            "CompanyEmployeeCount": {
+                "query": 2,
+                "source": "Company",
+                "pipeline": self.query_2_spec().pipeline,
+                "read": [],  # Same rows as query_2
+                "depends": {"Company": ["name", "count"]},
+                "refresh_keys": {"Company": ("companyId", "companyId")}  # Updated bucket -> all the buckets of its company
+            }
+        }
+
+    def query_1_spec(self):
+
+        """Query 1 to be executed (collection and operation): for each person, retrieve full name and their company's name"""
+
+        # Get the Company collection (whose documents are the buckets of employees)
+        company_collection = self.db['Company']
+
+        # Define the aggregation pipeline
+        pipeline = [
+            {
+                "$unwind": "$employees"  # One document per employee of each bucket
+            },
+            {
+                "$project": {  # Choose only certain attributes
+                    "_id": "$companyId",  # Same rows as Model 3, identified by the company
+                    "fullName": "$employees.fullName",
+                    "companyName": "$name"
+                }
+            }
+        ]
+
+        return AggregateQuery(company_collection, pipeline)
+
+    def query_2_spec(self):
+
+        """Query 2 to be executed (collection and operation): for each company, retrieve its name and the number of employees"""
+
+        # Get the Company collection (whose documents are the buckets of employees)
+        company_collection = self.db['Company']
+
+        # Define the aggregation pipeline
+        pipeline = [
+            {
+                "$group": {
+                    "_id": "$companyId",  # One result per company
+                    "companyName": {"$first": "$name"},  # Every bucket keeps the company name
+                    "numEmployees": {"$sum": "$count"}  # Add the counts of the buckets instead of measuring arrays
+                }
+            }
+        ]
+
+        return AggregateQuery(company_collection, pipeline)
@@ -0,0 +1,312 @@
+# coding=utf-8
+import datetime
+import time
+import json
+from pymongo import UpdateMany, UpdateOne
+from bulk_loader import BulkLoader
+from pipeline import GenerationPipeline, company_chunks
+from queries import AggregateQuery, UpdateQuery, UpdateSequence
+from parallel_generation import resolve_seed, split_companies, run_shards
+
+# Load configuration
+with open('config.json', 'r') as config_file:
+    config = json.load(config_file)
+
+class Model4:
+
+    """Hybrid model with extended references: every Person keeps the companyId reference and a copy of the company
+    name (the only company field that the queries read), and every Company keeps an employee counter instead of
+    the list of its employees"""
+
+    # Secondary indexes that can be created after the bulk load: profile name -> [(collection, keys)]
+    INDEX_PROFILES = {
+        "person_company": [("Person", [("companyId", 1)])],  # Reference used to propagate company renames
+        "person_birth": [("Person", [("dateOfBirth", 1)])]  # Date of birth filter of Query 3
+    }
+
+    # Optimized variants of the queries, timed and checked against the baseline: query -> {variant name: method}
+    QUERY_VARIANTS = {
+        3: {"range": "query_3_range_spec"}
+    }
+
+    # Documents of the loaded data (checked before running the queries on existing data):
+    # collection -> (each counted document is a "person" or a "company", filter of the counted documents, fields of every document)
+    DOCUMENTS = {
+        "Person": ("person", {}, ["fullName", "dateOfBirth", "companyId", "companyName"]),
+        "Company": ("company", {}, ["name", "numEmployees"])
+    }
+
+    # Collection and field that identify a person (people are sampled from it for point lookups)
+    PERSON_ID = ("Person", "_id")
+
+    def __init__(self, client, db):
+        self.client = client
+        self.db = db
+
+    def data_generator(self, n, workers=None, seed=None, dataset=None):
+
+        """Generate n documents (companies and people), splitting the companies and their employees across `workers` processes.
+        If a canonical `dataset` is given, its data is written instead (n is then taken from the dataset)"""
+
+        workers = workers or config['generation']['workers']  # Number of worker processes (with a default value from the config file)
+        seed = resolve_seed(seed)  # The same seed and number of workers always generate the same data
+
+        # 1. Collection Setup
+
+        # Create 2 different collections
+        collections = ['Person', 'Company']
+
+        # Drop existing collections except system collections
+        for collection_name in self.db.list_collection_names():
+            if not collection_name.startswith('system.'):
+                self.db.drop_collection(collection_name)  # Drop existing collections except system collections
+                print(f"Dropped collection: {collection_name}")
+
+        for collection in collections:
+            self.db.create_collection(collection)  # Create the collection
+
+        # 2. Data Generation
+
+        if dataset is not None:
+            # Project the canonical dataset into Model 4 documents (only the writes are left to do)
+            self._pipeline().run(dataset.chunks())
+            print(f"Loaded {dataset.n_companies} companies and {dataset.n_people} people from the dataset.")
+            print(f"Total: {dataset.n} documents.")
+            print("Data generation completed successfully.")
+            return
+
+        person_company_ratio = config['generation']['person_company_ratio']  # Ratio of people to companies (with a default value)
+        n_companies = n // person_company_ratio  # Number of companies to generate
+        n_people = n - n_companies  # Number of people to generate
+
+        # Companies are generated in chunks together with all of their employees, so the employee counter and the
+        # company name of every person are known when they are written. Every worker writes its own range of companies
+        shard_args = split_companies(n_companies, n_people, workers, seed)
+        run_shards(self, '_generate_shard', shard_args, seed)
+
+        print(f"Generated {n_companies} companies and {n_people} people with {workers} worker(s).")
+        print(f"Total: {n} documents.")
+        print("Data generation completed successfully.")
+
+    def _generate_shard(self, engine, n_companies, n_people, sizes=None):
+
+        """Generate and write n_companies companies and their n_people employees through the streaming pipeline"""
+
+        return self._pipeline().run(company_chunks(engine, n_companies, n_people, sizes=sizes))
+
+    def _pipeline(self):
+
+        """Streaming pipeline that writes chunks of companies and employees as Model 4 documents"""
+
+        return GenerationPipeline(self.db, self._to_documents)
+
+    def _to_documents(self, companies, people, company_indices):
+
+        """Transform a chunk of companies and their employees into Model 4 documents"""
+
+        for c in companies:
+            c["numEmployees"] = 0  # Employee counter instead of an array of references
+        for company_index, p in zip(company_indices.tolist(), people):
+            c = companies[company_index]
+            p["companyId"] = c["_id"]  # Reference to company
+            p["companyName"] = c["name"]  # Extended reference: copy of the company name
+            c["numEmployees"] += 1
+        return {"Company": companies, "Person": people}
+
+    def rename_companies(self, new_names):
+
+        """Rename companies ({company ID: new name}) and propagate the new names to the companyName of their
+        employees, with unordered bulk writes. Each rename is one UpdateMany on Person, which should be backed by
+        the person_company index"""
+
+        companies = BulkLoader(self.db['Company'])
+        people = BulkLoader(self.db['Person'])
+        for company_id, name in new_names.items():
+            companies.write(UpdateOne({"_id": company_id}, {"$set": {"name": name}}))
+            people.write(UpdateMany({"companyId": company_id}, {"$set": {"companyName": name}}))
+        companies.close()
+        people.close()
+
+    def materialized_views(self):
+
+        """Materialized views of Query 1 and Query 2 (maintained by materialized_views.MaterializedViews)"""
+
+        return {
+            "PersonCompanyView": {
+                "query": 1,
+                "source": "Person",
+                "pipeline": [{"$project": {"fullName": "$fullName", "companyName": "$companyName", "companyId": "$companyId"}}],
+                "read": [{"$project": {"fullName": 1, "companyName": 1}}],  # Same rows as query_1
+                "depends": {"Person": ["fullName", "companyName", "companyId"]},
+                "refresh_keys": {"Person": ("_id", "_id")}
+            },
+            "CompanyEmployeeCount": {
+                "query": 2,
+                "source": "Company",
+                "pipeline": [{"$project": {"companyName": "$name", "numEmployees": "$numEmployees"}}],
+                "read": [],  # Same rows as query_2
+                "depends": {"Company": ["name", "numEmployees"]},
+                "refresh_keys": {"Company": ("_id", "_id")}
+            }
+        }
+
+    def query_1_spec(self):
+
+        """Query 1 to be executed (collection and operation): for each person, retrieve full name and their company's name"""
+
+        # Get the Person collection
+        person_collection = self.db['Person']
+
+        # Define the aggregation pipeline
+        pipeline = [
+            {
+                "$project": {  # Choose only certain attributes
+                    "fullName": "$fullName",
+                    "companyName": "$companyName"  # Copy of the company name, no join needed
+                }
+            }
+        ]
+
+        return AggregateQuery(person_collection, pipeline)
+
+    def query_1(self):
+
+        """For each person, retrieve full name and their company's name"""
+
+        # Execute the aggregation query
+        start_time = time.time()
+        results = self.query_1_spec().stream(sample=5)  # Counts the results, keeping only the first 5
+        query_time = time.time() - start_time
+
+        # Display length of results
+        print("\n", "--" * 30)
+        print(f"\nQuery 1 executed in {query_time} seconds.")
+        print(f"Found {results.rows} people with their companies. First 5 results:")
+
+        for result in results.sample:  # Display only the first 5 results
+            print(f"- {result['fullName']} works at {result['companyName']}")
+
+        return query_time
+
+    def query_2_spec(self):
+
+        """Query 2 to be executed (collection and operation): for each company, retrieve its name and the number of employees"""
+
+        # Get the Company collection
+        company_collection = self.db['Company']
+
+        # Define the aggregation pipeline
+        pipeline = [
+            {
+                "$project": {  # Choose only certain attributes
+                    "companyName": "$name",
+                    "numEmployees": "$numEmployees"  # Employee counter, no array to measure
+                }
+            }
+        ]
+
+        return AggregateQuery(company_collection, pipeline)
+
+    def query_2(self):
+
+        """For each company, retrieve its name and the number of employees"""
+
+        # Execute the aggregation query
+        start_time = time.time()
+        results = self.query_2_spec().stream(sample=5)  # Counts the results, keeping only the first 5
+        query_time = time.time() - start_time
+
+        # Display length of results
+        print("\n", "--" * 30)
+        print(f"\nQuery 2 executed in {query_time} seconds.")
+        print(f"Found {results.rows} companies. First 5 results:")
+
+        for result in results.sample:  # Display only the first 5 results
+            print(f"- {result['companyName']} has {result['numEmployees']} employees")
+
+        return query_time
+
+    def query_3_spec(self):
+
+        """Query 3 to be executed (collection and operation): for each person born before 1988, update their age to “30”"""
+
+        # Get the Person collection
+        person_collection = self.db['Person']
+
+        return UpdateQuery(
+            person_collection,
+            filter = {
+                "$expr": {  # Allows us to use aggregation expressions (like $year) in the query
+                    "$lt": [{"$year": "$dateOfBirth"}, 1988]  # Compute year of birth and compare it
+                }
+            },
+            update = {"$set": {"age": 30}}
+        )
+
+    def query_3(self):
+
+        """For each person born before 1988, update their age to “30”"""
+
+        # Execute the update query
+        start_time = time.time()
+        results = self.query_3_spec().execute()
+        query_time = time.time() - start_time
+
+        # Display the number of documents updated
+        print("\n", "--" * 30)
+        print(f"\nQuery 3 executed in {query_time} seconds.")
+        print(f"Matched {results.matched_count} people and updated {results.modified_count} people born before 1988 to have age 30.")
+
+        return query_time
+
+    def query_3_range_spec(self):
+
+        """Query 3 with a range predicate on the date of birth: same people as $year < 1988, but it can use an index on dateOfBirth"""
+
+        # Get the Person collection
+        person_collection = self.db['Person']
+
+        return UpdateQuery(
+            person_collection,
+            filter = {"dateOfBirth": {"$lt": datetime.datetime(1988, 1, 1)}},  # Born before 1988 <=> born before January 1st, 1988
+            update = {"$set": {"age": 30}}
+        )
+
+    def query_4_spec(self):
+
+        """Query 4 to be executed (collection and operation): for each company, update its name to include the word “Company”,
+        propagating the new name to the copies kept by its employees"""
+
+        return UpdateSequence([
+            UpdateQuery(self.db['Company'], filter = {}, update = {"$set": {"name": "Company"}}),  # No filter, update all companies
+            UpdateQuery(self.db['Person'], filter = {}, update = {"$set": {"companyName": "Company"}})  # Every person works at a renamed company
+        ])
+
+    def query_4(self):
+
+        """For each company, update its name to include the word “Company”"""
+
+        # Execute the update query
+        start_time = time.time()
+        company_results, person_results = self.query_4_spec().execute()
+        query_time = time.time() - start_time
+
+        # Display the number of documents updated
+        print("\n", "--" * 30)
+        print(f"\nQuery 4 executed in {query_time} seconds.")
+        print(f"Matched {company_results.matched_count} companies and updated {company_results.modified_count} companies to have the name 'Company'.")
+        print(f"Updated the company name of {person_results.modified_count} people.")
+
+        return query_time
+
+    def point_lookup_spec(self, person_id):
+
+        """Point lookup to be executed (collection and operation): full name and company name of one person"""
+
+        # Get the Person collection
+        person_collection = self.db['Person']
+
+        # Same pipeline as Query 1, for one person found with the _id index
+        pipeline = [{"$match": {"_id": person_id}}] + self.query_1_spec().pipeline
+
+        return AggregateQuery(person_collection, pipeline)
@@ -2,11 +2,17 @@
 from model1 import Model1
 from model2 import Model2
 from model3 import Model3
+from model4 import Model4
+from model3_buckets import Model3Buckets
+from data_loading import check_existing_data, load_data
+from dataset_cache import DatasetCache
+from indexes import NO_INDEXES, apply_index_profile
+from parallel_generation import resolve_seed
+import argparse
 import json
 import sys
-from pymongo import MongoClient
+from connection import connect
 from dotenv import load_dotenv
-import os
 
 # Load environment variables from .env file
 load_dotenv()
@@ -15,6 +21,50 @@ load_dotenv()
 with open('config.json', 'r') as config_file:
     config = json.load(config_file)
 
+# Command line options for the data generation
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate the data of a document model and time its queries.")
+    parser.add_argument('--workers', type=int, default=config['generation']['workers'],
+                        help="Number of processes that generate and write the data in parallel")
+    parser.add_argument('--seed', type=int, default=config['generation']['seed'],
+                        help="Seed of the data generation (the same seed and number of workers give the same data)")
+    parser.add_argument('--canonical', action='store_true',
+                        help="Generate one canonical dataset per number of documents and load the same data into every model")
+    parser.add_argument('--dataset', metavar='PATH',
+                        help="Directory of a canonical dataset: loaded if it exists, otherwise generated and saved there (implies --canonical)")
+    parser.add_argument('--cache', action='store_true',
+                        help="Load the data from the on-disk dataset cache when it was already generated with the same parameters")
+    parser.add_argument('--index-profile', default=config['loading']['index_profile'],
+                        help="Index profile of the model (INDEX_PROFILES) created after loading the data ('none' for no secondary indexes)")
+    parser.add_argument('--query-only', action='store_true',
+                        help="Do not generate the data: check that the database already holds the data of the chosen model and run its queries on it")
+    return parser.parse_args()
+
+# Create the secondary indexes of the selected profile once the data is loaded
+def create_indexes(m, profile):
+    if profile not in (NO_INDEXES, *type(m).INDEX_PROFILES):
+        print(f"{type(m).__name__} has no index profile '{profile}', no secondary indexes are created.")
+        profile = NO_INDEXES
+    for index in apply_index_profile(m, profile):
+        print(f"Created index {index['index']} on {index['collection']} in {index['build_time']:.3f} seconds ({index['size_bytes'] / 1024 ** 2:.1f} MB).")
+
+# Load the data of the model (or, in query-only mode, check the data already loaded); returns False if the queries cannot run
+def prepare_data(m, args, datasets, cache):
+    if args.query_only:
+        n = int(input("Insert the number of documents of the existing data:"))
+        problems = check_existing_data(m, n)
+        for problem in problems:
+            print(problem)
+        if problems:
+            print(f"The database does not hold the data of {type(m).__name__} with {n} documents: run without --query-only to generate it.")
+            return False
+        print(f"Using the existing data of {type(m).__name__} ({n} documents) and its current indexes.")
+        return True
+    n = int(input("Insert the number of documents to create:"))
+    load_data(m, n, args, datasets, cache)
+    create_indexes(m, args.index_profile)
+    return True
+
 # Show options for the user when the program starts
 def show_options():
     print("Choose the option you want to execute:")
@@ -22,95 +72,148 @@ def show_options():
     print("\t 1 - Model 1")
     print("\t 2 - Model 2")
     print("\t 3 - Model 3")
+    print("\t 4 - Model 4")
+    print("\t 5 - Model 3 with employee buckets")
 
-show_options()
-op = int(input())
+def main():
+    args = parse_args()
+    cache = None
+    if args.cache:
+        cache = DatasetCache()
+        args.seed = resolve_seed(args.seed)  # Cached datasets are identified by their seed
 
-# Connect to MongoDB from environment variable - Note: Change connection string as needed
-client = MongoClient(os.getenv('MONGO_PORT'))
+    show_options()
+    op = int(input())
 
-# Connect to the database (creates it lazily if it doesn't exist) - will 
-# be actually created when the first document is insereted into a collection
-db_name = config['database']['name']
+    # Connect to MongoDB from environment variable - Note: Change connection string as needed
+    client = connect()
 
-db = client[db_name]  # Use the database name from the config file
+    # Connect to the database (creates it lazily if it doesn't exist) - will 
+    # be actually created when the first document is insereted into a collection
+    db_name = config['database']['name']
 
-while op != 0:
-    if op == 1:
-        n = int(input("Insert the number of documents to create:"))
-        m = Model1(client=client, db=db)
-        m.data_generator(n)
-        q = int(input("\nExecute queries? (1 for Yes, 0 for No): "))
-        if q == 1:
-            print("Executing queries...")
-            time_q1 = m.query_1()
-            time_q2 = m.query_2()
-            time_q3 = m.query_3()
-            time_q4 = m.query_4()
-            print("\n", "==" * 10, "MODEL 1 RESULTS", "==" * 10, "\n")
-            print("Query 1 time: ", time_q1)
-            print("Query 2 time: ", time_q2)
-            print("Query 3 time: ", time_q3)
-            print("Query 4 time: ", time_q4)
-            print("\n", "==" * 8, "END OF MODEL 1 RESULTS", "==" * 8, "\n")
-        elif q == 0:
-            print("Skipping query execution.")
-        else:
-            print("Invalid input. Please enter 1 for Yes or 0 for No.")
-            sys.exit()
-    elif op == 2:
-        n = int(input("Insert the number of documents to create:"))
-        m = Model2(client=client, db=db)
-        m.data_generator(n)
-        q = int(input("\nExecute queries? (1 for Yes, 0 for No): "))
-        if q == 1:
-            print("Executing queries...")
-            time_q1 = m.query_1()
-            time_q2 = m.query_2()
-            time_q3 = m.query_3()
-            time_q4 = m.query_4()
-            print("\n", "==" * 10, "MODEL 2 RESULTS", "==" * 10, "\n")
-            print("Query 1 time: ", time_q1)
-            print("Query 2 time: ", time_q2)
-            print("Query 3 time: ", time_q3)
-            print("Query 4 time: ", time_q4)
-            print("\n", "==" * 8, "END OF MODEL 2 RESULTS", "==" * 8, "\n")
-        elif q == 0:
-            print("Skipping query execution.")
-        else:
-            print("Invalid input. Please enter 1 for Yes or 0 for No.")
-            sys.exit()
-    elif op == 3:
-        n = int(input("Insert the number of documents to create:"))
-        m = Model3(client=client, db=db)
-        m.data_generator(n)
-        q = int(input("\nExecute queries? (1 for Yes, 0 for No): "))
-        if q == 1:
-            print("Executing queries...")
-            time_q1 = m.query_1()
-            time_q2 = m.query_2()
-            time_q3 = m.query_3()
-            time_q4 = m.query_4()
-            print("\n", "==" * 10, "MODEL 3 RESULTS", "==" * 10, "\n")
-            print("Query 1 time: ", time_q1)
-            print("Query 2 time: ", time_q2)
-            print("Query 3 time: ", time_q3)
-            print("Query 4 time: ", time_q4)
-            print("\n", "==" * 8, "END OF MODEL 3 RESULTS", "==" * 8, "\n")
-        elif q == 0:
-            print("Skipping query execution.")
+    db = client[db_name]  # Use the database name from the config file
+    datasets = {}  # Canonical datasets generated in this session (by number of documents)
+
+    while op != 0:
+        if op == 1:
+            m = Model1(client=client, db=db)
+            ready = prepare_data(m, args, datasets, cache)
+            q = int(input("\nExecute queries? (1 for Yes, 0 for No): ")) if ready else 0
+            if q == 1:
+                print("Executing queries...")
+                time_q1 = m.query_1()
+                time_q2 = m.query_2()
+                time_q3 = m.query_3()
+                time_q4 = m.query_4()
+                print("\n", "==" * 10, "MODEL 1 RESULTS", "==" * 10, "\n")
+                print("Query 1 time: ", time_q1)
+                print("Query 2 time: ", time_q2)
+                print("Query 3 time: ", time_q3)
+                print("Query 4 time: ", time_q4)
+                print("\n", "==" * 8, "END OF MODEL 1 RESULTS", "==" * 8, "\n")
+            elif q == 0:
+                print("Skipping query execution.")
+            else:
+                print("Invalid input. Please enter 1 for Yes or 0 for No.")
+                sys.exit()
+        elif op == 2:
+            m = Model2(client=client, db=db)
+            ready = prepare_data(m, args, datasets, cache)
+            q = int(input("\nExecute queries? (1 for Yes, 0 for No): ")) if ready else 0
+            if q == 1:
+                print("Executing queries...")
+                time_q1 = m.query_1()
+                time_q2 = m.query_2()
+                time_q3 = m.query_3()
+                time_q4 = m.query_4()
+                print("\n", "==" * 10, "MODEL 2 RESULTS", "==" * 10, "\n")
+                print("Query 1 time: ", time_q1)
+                print("Query 2 time: ", time_q2)
+                print("Query 3 time: ", time_q3)
+                print("Query 4 time: ", time_q4)
+                print("\n", "==" * 8, "END OF MODEL 2 RESULTS", "==" * 8, "\n")
+            elif q == 0:
+                print("Skipping query execution.")
+            else:
+                print("Invalid input. Please enter 1 for Yes or 0 for No.")
+                sys.exit()
+        elif op == 3:
+            m = Model3(client=client, db=db)
+            ready = prepare_data(m, args, datasets, cache)
+            q = int(input("\nExecute queries? (1 for Yes, 0 for No): ")) if ready else 0
+            if q == 1:
+                print("Executing queries...")
+                time_q1 = m.query_1()
+                time_q2 = m.query_2()
+                time_q3 = m.query_3()
+                time_q4 = m.query_4()
+                print("\n", "==" * 10, "MODEL 3 RESULTS", "==" * 10, "\n")
+                print("Query 1 time: ", time_q1)
+                print("Query 2 time: ", time_q2)
+                print("Query 3 time: ", time_q3)
+                print("Query 4 time: ", time_q4)
+                print("\n", "==" * 8, "END OF MODEL 3 RESULTS", "==" * 8, "\n")
+            elif q == 0:
+                print("Skipping query execution.")
+            else:
+                print("Invalid input. Please enter 1 for Yes or 0 for No.")
+                sys.exit()
+        elif op == 4:
+            m = Model4(client=client, db=db)
+            ready = prepare_data(m, args, datasets, cache)
+            q = int(input("\nExecute queries? (1 for Yes, 0 for No): ")) if ready else 0
+            if q == 1:
+                print("Executing queries...")
+                time_q1 = m.query_1()
+                time_q2 = m.query_2()
+                time_q3 = m.query_3()
+                time_q4 = m.query_4()
+                print("\n", "==" * 10, "MODEL 4 RESULTS", "==" * 10, "\n")
+                print("Query 1 time: ", time_q1)
+                print("Query 2 time: ", time_q2)
+                print("Query 3 time: ", time_q3)
+                print("Query 4 time: ", time_q4)
+                print("\n", "==" * 8, "END OF MODEL 4 RESULTS", "==" * 8, "\n")
+            elif q == 0:
+                print("Skipping query execution.")
+            else:
+                print("Invalid input. Please enter 1 for Yes or 0 for No.")
+                sys.exit()
+        elif op == 5:
+            m = Model3Buckets(client=client, db=db)
+            ready = prepare_data(m, args, datasets, cache)
+            q = int(input("\nExecute queries? (1 for Yes, 0 for No): ")) if ready else 0
+            if q == 1:
+                print("Executing queries...")
+                time_q1 = m.query_1()
+                time_q2 = m.query_2()
+                time_q3 = m.query_3()
+                time_q4 = m.query_4()
+                print("\n", "==" * 10, "MODEL 3 (BUCKETS) RESULTS", "==" * 10, "\n")
+                print("Query 1 time: ", time_q1)
+                print("Query 2 time: ", time_q2)
+                print("Query 3 time: ", time_q3)
+                print("Query 4 time: ", time_q4)
+                print("\n", "==" * 8, "END OF MODEL 3 (BUCKETS) RESULTS", "==" * 8, "\n")
+            elif q == 0:
+                print("Skipping query execution.")
+            else:
+                print("Invalid input. Please enter 1 for Yes or 0 for No.")
+                sys.exit()
         else:
-            print("Invalid input. Please enter 1 for Yes or 0 for No.")
+            print ("Exitting and closing the client...")
+            client.close()  # Close the connection to MongoDB
             sys.exit()
-    else:
-        print ("Exitting and closing the client...")
-        client.close()  # Close the connection to MongoDB
-        sys.exit()
 
-    # After each operation, show options again
-    show_options()
-    op = int(input())
+        # After each operation, show options again
+        show_options()
+        op = int(input())
+
+    # Final cleanup when the user selects option 0 to exit the program
+    print("Exitting and closing the client...")
+    client.close()  # Close the connection to MongoDB
 
-# Final cleanup when the user selects option 0 to exit the program
-print("Exitting and closing the client...")
-client.close()  # Close the connection to MongoDB
\ No newline at end of file
+# Guard needed so that worker processes can import this module without starting the program
+if __name__ == '__main__':
+    main()
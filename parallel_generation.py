@@ -0,0 +1,74 @@
+# coding=utf-8
+import json
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from connection import connect
+from data_engine import CompanySizes, make_engine
+
+# Load configuration
+with open('config.json', 'r') as config_file:
+    config = json.load(config_file)
+
+def resolve_seed(seed=None):
+
+    """Seed of a generation run: the given one, the one in the config file or a new random one (printed so the run can be repeated)"""
+
+    if seed is None:
+        seed = config['generation']['seed']
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % 2**63)
+        print(f"Generating data with random seed {seed}.")
+    return seed
+
+def derive_seeds(seed, n_workers):
+
+    """One independent seed per worker, derived from the run seed (the same seed and worker count give the same seeds)"""
+
+    return [int(child.generate_state(1, dtype=np.uint64)[0]) for child in np.random.SeedSequence(seed).spawn(n_workers)]
+
+def split_range(n, n_parts):
+
+    """Split range(n) into n_parts contiguous (start, stop) shards of almost equal size"""
+
+    bounds = [n * i // n_parts for i in range(n_parts + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def split_companies(n_companies, n_people, n_parts, seed):
+
+    """Split the companies into n_parts contiguous shards and draw how many of the n_people work in each shard
+    (people are assigned at random following the company size distribution, so shard sizes follow a multinomial
+    with the total weight of every shard). Returns (n_companies, n_people, CompanySizes of the shard) per shard"""
+
+    sizes = CompanySizes(n_companies)
+    company_ranges = split_range(n_companies, n_parts)
+    shard_weights = np.array([sizes.total(start, stop) for start, stop in company_ranges])
+    people_shards = np.random.default_rng(seed).multinomial(n_people, shard_weights / max(shard_weights.sum(), 1))
+    return [(stop - start, int(n_shard_people), sizes.shard(start, stop)) for (start, stop), n_shard_people in zip(company_ranges, people_shards)]
+
+def run_shards(model, method_name, shard_args, seed):
+
+    """Run model.<method_name>(engine, *args) once per shard and return the results in shard order.
+
+    Every shard gets its own engine seeded with a seed derived from the run seed. With a single shard it runs in
+    this process; otherwise each shard runs in its own process with its own MongoClient and writes its data directly"""
+
+    seeds = derive_seeds(seed, len(shard_args))
+    if len(shard_args) == 1:
+        return [getattr(model, method_name)(make_engine(seed=seeds[0]), *shard_args[0])]
+
+    model_class = type(model)
+    with ProcessPoolExecutor(max_workers=len(shard_args)) as pool:
+        futures = [pool.submit(_run_shard, model_class, method_name, args, shard_seed) for args, shard_seed in zip(shard_args, seeds)]
+        return [future.result() for future in futures]
+
+def _run_shard(model_class, method_name, args, seed):
+
+    """Worker process: connect to MongoDB, build the model and generate one shard"""
+
+    client = connect()  # Every worker uses its own connection
+    db = client[config['database']['name']]
+    try:
+        model = model_class(client=client, db=db)
+        return getattr(model, method_name)(make_engine(seed=seed), *args)
+    finally:
+        client.close()
@@ -0,0 +1,170 @@
+# coding=utf-8
+import asyncio
+import json
+import queue
+import threading
+import numpy as np
+from bulk_loader import AsyncBulkLoader, BulkLoader
+from data_engine import CompanySizes
+
+# Load configuration
+with open('config.json', 'r') as config_file:
+    config = json.load(config_file)
+
+_END = object()  # Marks the end of a stream between two stages
+
+def company_chunks(engine, n_companies, n_people, chunk_size=None, sizes=None, person_company_ratio=None):
+
+    """Produce stage: yield (companies, people, company_indices) chunks of consecutive companies together with all of
+    their employees, where company_indices[i] is the position in `companies` of the company of people[i].
+    The people are assigned to the companies following `sizes` (a CompanySizes over these n_companies companies,
+    by default the distribution of the config file). The chunks hold about engine.batch_size people, given the
+    person_company_ratio of the data (default: config file).
+
+    Only one chunk is generated at a time, so no global list of companies or people is ever kept in memory"""
+
+    person_company_ratio = person_company_ratio or config['generation']['person_company_ratio']
+    chunk_size = chunk_size or max(1, engine.batch_size // person_company_ratio)  # Companies per chunk
+    sizes = sizes or CompanySizes(n_companies)
+    remaining_companies, remaining_people = n_companies, n_people
+    remaining_weight = sizes.total()
+    while remaining_companies > 0:
+        companies = engine.companies(min(chunk_size, remaining_companies))
+        first_company = n_companies - remaining_companies
+        weights = sizes.weights(first_company, first_company + len(companies))
+        if len(companies) == remaining_companies:
+            remaining_weight = weights.sum()  # Last chunk: every remaining person (without rounding errors)
+        counts = engine.employee_counts(weights, remaining_people, remaining_weight)
+        company_indices = np.repeat(np.arange(len(companies)), counts)
+        people = engine.people(company_indices, [c["domain"] for c in companies])
+        remaining_companies -= len(companies)
+        remaining_people -= len(people)
+        remaining_weight -= weights.sum()
+        yield companies, people, company_indices
+
+class GenerationPipeline:
+
+    """Streaming generation pipeline: produce -> transform into the model shape -> batch -> write.
+
+    The stages run in their own threads connected by bounded queues, so generating the next chunk overlaps with
+    writing the previous one and the memory in use depends on the batch and queue sizes, not on the number of documents"""
+
+    def __init__(self, db, transform, batch_sizes=None, queue_size=None):
+        self.db = db
+        self.transform = transform  # Function (companies, people, company_indices) -> {collection name: documents or write models}
+        self.batch_sizes = batch_sizes or {}  # Batch size of each collection (default: loading batch size of the config file)
+        self.queue_size = queue_size or config['loading']['queue_size']  # Maximum number of chunks waiting between two stages
+        self.errors = []
+        self.stop = threading.Event()
+
+    def run(self, chunks):
+        """Run the pipeline over the chunks produced by `chunks` (e.g. company_chunks) and return the number of written items per collection"""
+        produced = queue.Queue(maxsize=self.queue_size)
+        transformed = queue.Queue(maxsize=self.queue_size)
+        threads = [
+            threading.Thread(target=self._stage, args=(iter(chunks), None, produced), daemon=True),  # Produce
+            threading.Thread(target=self._stage, args=(self._drain(produced), self._transform, transformed), daemon=True)  # Transform
+        ]
+        for thread in threads:
+            thread.start()
+
+        # Batch and write stage (in this thread): every collection buffers its items in a BulkLoader
+        loaders = {}
+        try:
+            for output in self._drain(transformed):
+                for collection_name, items in output.items():
+                    if collection_name not in loaders:
+                        loaders[collection_name] = BulkLoader(self.db[collection_name], batch_size=self.batch_sizes.get(collection_name))
+                    loader = loaders[collection_name]
+                    for item in items:
+                        if isinstance(item, dict):
+                            loader.insert(item)  # Document
+                        else:
+                            loader.write(item)  # Write model (UpdateOne, ...)
+            if self.errors:
+                raise self.errors[0]
+            for loader in loaders.values():
+                loader.close()  # Write the last partial batches
+        finally:
+            self.stop.set()  # Unblock the other stages if this one stopped early
+            for thread in threads:
+                thread.join()
+        return {collection_name: loader.n_written for collection_name, loader in loaders.items()}
+
+    def _transform(self, chunk):
+        return self.transform(*chunk)
+
+    def _stage(self, items, function, output):
+        """Apply `function` (if any) to every item and put the results into the bounded `output` queue"""
+        try:
+            for item in items:
+                if self.stop.is_set():
+                    return
+                self._put(output, function(item) if function else item)
+        except Exception as error:
+            self.errors.append(error)
+        finally:
+            self._put(output, _END)
+
+    def _put(self, output, item):
+        while not self.stop.is_set():
+            try:
+                output.put(item, timeout=0.1)  # Blocks while the next stage is behind (bounded memory)
+                return
+            except queue.Full:
+                pass
+
+    def _drain(self, source):
+        """Iterate over the items of a queue until the end of the stream (or until the pipeline is stopped)"""
+        while True:
+            try:
+                item = source.get(timeout=0.1)
+            except queue.Empty:
+                if self.stop.is_set():
+                    return
+                continue
+            if item is _END:
+                return
+            yield item
+
+class AsyncGenerationPipeline:
+
+    """Asyncio version of GenerationPipeline for pymongo async databases: each chunk is produced and transformed in a
+    worker thread (asyncio.to_thread) while the event loop keeps the batches of the previous chunks in flight
+    (AsyncBulkLoader), so generation overlaps with the writes without a thread per stage"""
+
+    def __init__(self, db, transform, batch_sizes=None):
+        self.db = db
+        self.transform = transform  # Function (companies, people, company_indices) -> {collection name: documents or write models}
+        self.batch_sizes = batch_sizes or {}  # Batch size of each collection (default: loading batch size of the config file)
+
+    @classmethod
+    def from_pipeline(cls, db, pipeline):
+        """Async pipeline with the transform and batch sizes of a (synchronous) GenerationPipeline"""
+        return cls(db, pipeline.transform, pipeline.batch_sizes)
+
+    async def run(self, chunks):
+        """Run the pipeline over the chunks produced by `chunks` (e.g. company_chunks) and return the number of written items per collection"""
+        chunks = iter(chunks)
+        loaders = {}
+        while True:
+            output = await asyncio.to_thread(self._next_output, chunks)
+            if output is None:
+                break
+            for collection_name, items in output.items():
+                if collection_name not in loaders:
+                    loaders[collection_name] = AsyncBulkLoader(self.db[collection_name], batch_size=self.batch_sizes.get(collection_name))
+                loader = loaders[collection_name]
+                for item in items:
+                    if isinstance(item, dict):
+                        await loader.insert(item)  # Document
+                    else:
+                        await loader.write(item)  # Write model (UpdateOne, ...)
+        for loader in loaders.values():
+            await loader.close()  # Write the last partial batches
+        return {collection_name: loader.n_written for collection_name, loader in loaders.items()}
+
+    def _next_output(self, chunks):
+        """Produce and transform the next chunk (None at the end of the stream)"""
+        chunk = next(chunks, None)
+        return None if chunk is None else self.transform(*chunk)
@@ -0,0 +1,341 @@
+# coding=utf-8
+import hashlib
+import json
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from connection import query_read_concern
+
+# Load configuration
+with open('config.json', 'r') as config_file:
+    config = json.load(config_file)
+
+# Result of consuming a cursor without keeping it: number of rows, first rows kept and times in nanoseconds
+StreamResult = namedtuple('StreamResult', ['rows', 'sample', 'first_row_ns', 'drain_ns'])
+
+# Name of the original version of every query (query_k_spec() of the models)
+BASELINE = 'baseline'
+
+# Value of a missing field (a field set to null is kept as None)
+_MISSING = object()
+
+class ReadQuery:
+
+    """Base of the read queries: subclasses implement rows(batch_size, raw), an iterator over the results"""
+
+    kind = 'read'
+
+    def execute(self):
+        """Run the query and fetch every result"""
+        return list(self.rows())
+
+    def stream(self, batch_size=None, raw=None, sample=0):
+        """Iterate over the results without keeping them: count them, keep only the first `sample` ones and measure
+        the time to the first row and to drain the cursor. Results are fetched `batch_size` documents per round trip
+        and, if raw, returned as RawBSONDocument (fields are only decoded when they are read), so client memory does
+        not grow with the number of results"""
+        batch_size = batch_size or config['queries']['batch_size']
+        raw = config['queries']['raw_bson'] if raw is None else raw
+
+        rows, kept, first_row_ns = 0, [], None
+        start_time = time.perf_counter_ns()
+        for document in self.rows(batch_size, raw):
+            if rows == 0:
+                first_row_ns = time.perf_counter_ns() - start_time
+            if rows < sample:
+                kept.append(document)
+            rows += 1
+        return StreamResult(rows, kept, first_row_ns, time.perf_counter_ns() - start_time)
+
+    def result_signature(self):
+        """Multiset of the results, independent of their order and of the order of their fields"""
+        return Counter(json.dumps(result, sort_keys=True, default=str) for result in self.execute())
+
+    @staticmethod
+    def _read_options(collection, raw=False):
+        """Collection with the query read concern of the config file (and RawBSONDocument results if raw)"""
+        if raw:
+            return collection.with_options(codec_options=CodecOptions(document_class=RawBSONDocument), read_concern=query_read_concern())
+        return collection.with_options(read_concern=query_read_concern())
+
+class AggregateQuery(ReadQuery):
+
+    """Read query: an aggregation pipeline run on a collection"""
+
+    def __init__(self, collection, pipeline):
+        self.collection = collection
+        self.pipeline = pipeline
+
+    def rows(self, batch_size=None, raw=False):
+        """Cursor over the results of the pipeline"""
+        collection = self._read_options(self.collection, raw)
+        if batch_size:
+            return collection.aggregate(self.pipeline, batchSize=batch_size)
+        return collection.aggregate(self.pipeline)
+
+    async def execute_async(self):
+        """Run the query on an async collection (pymongo AsyncMongoClient) and fetch every result"""
+        cursor = await self._read_options(self.collection).aggregate(self.pipeline)
+        return await cursor.to_list()
+
+    def explain(self):
+        """Explain the pipeline with executionStats verbosity (the server runs it but does not return the results)"""
+        command = {"aggregate": self.collection.name, "pipeline": self.pipeline, "cursor": {}}
+        return self.collection.database.command("explain", command, verbosity="executionStats")
+
+class HashJoinQuery(ReadQuery):
+
+    """Read query joined on the client (hash join): the build side (one key and one value per document of a small
+    collection) is loaded once into a dictionary, then the documents of the probe collection are streamed and each one
+    is joined with a dictionary lookup. Returns the same rows as $lookup + $unwind + $project on the server:
+    {_id, <fields of the probe documents>, <output_field>}, without the documents that have no match"""
+
+    def __init__(self, collection, fields, local_field, build_collection, build_field, output_field):
+        self.collection = collection  # Probe side
+        self.fields = fields  # Fields of the probe documents copied to the results
+        self.local_field = local_field  # Join key of the probe documents (matched with the _id of the build side)
+        self.build_collection = build_collection
+        self.build_field = build_field  # Field of the build side copied to the results
+        self.output_field = output_field
+
+    def rows(self, batch_size=None, raw=False):
+        """Generator of the joined results"""
+        table = {document["_id"]: document.get(self.build_field, _MISSING)
+                 for document in self._read_options(self.build_collection).find({}, {self.build_field: 1})}
+        probe = self._read_options(self.collection, raw).find({}, self._probe_projection())
+        if batch_size:
+            probe = probe.batch_size(batch_size)
+        for document in probe:
+            key = document.get(self.local_field)
+            if key in table:  # Same as $unwind, which drops the documents without a match
+                yield self._join(document, table[key])
+
+    async def execute_async(self):
+        """Run the join on async collections (pymongo AsyncMongoClient) and fetch every result"""
+        table = {document["_id"]: document.get(self.build_field, _MISSING)
+                 async for document in self._read_options(self.build_collection).find({}, {self.build_field: 1})}
+        return [self._join(document, table[document.get(self.local_field)])
+                async for document in self._read_options(self.collection).find({}, self._probe_projection())
+                if document.get(self.local_field) in table]
+
+    def explain(self):
+        """Explain the two collection reads and combine them as the executionStats of a single plan"""
+        explains = [
+            self.build_collection.database.command(
+                "explain", {"find": self.build_collection.name, "filter": {}, "projection": {self.build_field: 1}},
+                verbosity="executionStats"),
+            self.collection.database.command(
+                "explain", {"find": self.collection.name, "filter": {}, "projection": self._probe_projection()},
+                verbosity="executionStats")
+        ]
+        stats = [explain["executionStats"] for explain in explains]
+        return {"executionStats": {
+            "executionTimeMillis": sum(s["executionTimeMillis"] for s in stats),
+            "totalDocsExamined": sum(s["totalDocsExamined"] for s in stats),
+            "totalKeysExamined": sum(s["totalKeysExamined"] for s in stats),
+            "executionStages": {"stage": "CLIENT_HASH_JOIN", "inputStages": [s["executionStages"] for s in stats]}
+        }}
+
+    def _probe_projection(self):
+        return {field: 1 for field in [*self.fields, self.local_field]}
+
+    def _join(self, document, value):
+        row = {"_id": document["_id"]}
+        for field in self.fields:
+            if field in document:
+                row[field] = document[field]
+        if value is not _MISSING:  # As $project, which leaves out the fields missing from the build document
+            row[self.output_field] = value
+        return row
+
+class PartitionedQuery(ReadQuery):
+
+    """Aggregation split into `partitions` ranges of a field of the driving collection (by default _id). Every
+    partition runs the pipeline, restricted to its range with a leading $match, on its own cursor in its own thread,
+    and the results are concatenated in partition order. The field must keep together the documents that the
+    pipeline combines (e.g. the grouping key of a $group), so the results of the partitions never overlap"""
+
+    def __init__(self, query, partitions, field="_id"):
+        self.query = query  # AggregateQuery run on every partition
+        self.collection = query.collection
+        self.partitions = partitions
+        self.field = field
+        self._boundaries = None
+
+    def boundaries(self):
+        """Values of the field that split the collection into partitions of about the same number of documents
+        (computed once by the server with $bucketAuto and reused by later executions)"""
+        if self._boundaries is None:
+            buckets = self.collection.aggregate([{"$bucketAuto": {"groupBy": f"${self.field}", "buckets": self.partitions}}])
+            self._boundaries = [bucket["_id"]["min"] for bucket in list(buckets)[1:]]
+        return self._boundaries
+
+    def partition_queries(self):
+        """One AggregateQuery per partition: [lower bound, upper bound) of the field, open at both ends"""
+        bounds = [None] + self.boundaries() + [None]
+        queries = []
+        for lower, upper in zip(bounds[:-1], bounds[1:]):
+            condition = {}
+            if lower is not None:
+                condition["$gte"] = lower
+            if upper is not None:
+                condition["$lt"] = upper
+            match = [{"$match": {self.field: condition}}] if condition else []
+            queries.append(AggregateQuery(self.collection, match + self.query.pipeline))
+        return queries
+
+    def rows(self, batch_size=None, raw=False):
+        """Generator of the results of all partitions, drained concurrently"""
+        queries = self.partition_queries()
+        with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+            futures = [pool.submit(lambda query: list(query.rows(batch_size, raw)), query) for query in queries]
+            for future in futures:
+                yield from future.result()
+
+    def explain(self):
+        """Explain every partition (one after the other) and combine them as the executionStats of a single plan.
+        The partitions run at the same time, so the server time is the one of the slowest partition, while the
+        documents and index keys examined add up"""
+        stats = [execution_stats(query.explain()) for query in self.partition_queries()]
+        return {"executionStats": {
+            "executionTimeMillis": max(s["server_time_ms"] for s in stats),
+            "totalDocsExamined": sum(s["docs_examined"] for s in stats),
+            "totalKeysExamined": sum(s["keys_examined"] for s in stats),
+            "executionStages": {"stage": "PARTITIONS", "inputStages": [{"stage": s["plan"]} for s in stats]}
+        }}
+
+class UpdateQuery:
+
+    """Write query: an update_many on a collection"""
+
+    kind = 'write'
+
+    def __init__(self, collection, filter, update, array_filters=None):
+        self.collection = collection
+        self.filter = filter
+        self.update = update
+        self.array_filters = array_filters
+
+    def execute(self):
+        """Apply the update and return the UpdateResult"""
+        return self.collection.update_many(self.filter, self.update, array_filters=self.array_filters)
+
+    async def execute_async(self):
+        """Apply the update on an async collection (pymongo AsyncMongoClient) and return the UpdateResult"""
+        return await self.collection.update_many(self.filter, self.update, array_filters=self.array_filters)
+
+    def explain(self):
+        """Explain the update with executionStats verbosity (the server evaluates it but does not write anything)"""
+        update = {"q": self.filter, "u": self.update, "multi": True}
+        if self.array_filters is not None:
+            update["arrayFilters"] = self.array_filters
+        command = {"update": self.collection.name, "updates": [update]}
+        return self.collection.database.command("explain", command, verbosity="executionStats")
+
+    def result_signature(self):
+        """Digest of the collection after the update, computed on a scratch copy so the data is not modified"""
+        db = self.collection.database
+        scratch_name = f"{self.collection.name}_verify"
+        self.collection.aggregate([{"$match": {}}, {"$out": scratch_name}])  # Server-side copy of the collection
+        try:
+            UpdateQuery(db[scratch_name], self.filter, self.update, self.array_filters).execute()
+            scratch = db.get_collection(scratch_name, codec_options=CodecOptions(document_class=RawBSONDocument))
+            digest = hashlib.sha1()
+            for document in scratch.find().sort("_id", 1):
+                digest.update(document.raw)  # Same bytes <=> same documents with the same fields in the same order
+            return digest.hexdigest()
+        finally:
+            db.drop_collection(scratch_name)
+
+class UpdateSequence:
+
+    """Write query made of several updates applied one after the other (e.g. an update and its propagation to the
+    denormalized copies of the updated fields in another collection)"""
+
+    kind = 'write'
+
+    def __init__(self, updates):
+        self.updates = updates  # UpdateQuery objects, in execution order
+
+    def execute(self):
+        """Apply every update and return their UpdateResults"""
+        return [update.execute() for update in self.updates]
+
+    async def execute_async(self):
+        """Apply every update, one after the other, on async collections and return their UpdateResults"""
+        return [await update.execute_async() for update in self.updates]
+
+    def explain(self):
+        """Explain every update and combine them as the executionStats of a single plan"""
+        stats = [update.explain()["executionStats"] for update in self.updates]
+        return {"executionStats": {
+            "executionTimeMillis": sum(s["executionTimeMillis"] for s in stats),
+            "totalDocsExamined": sum(s["totalDocsExamined"] for s in stats),
+            "totalKeysExamined": sum(s["totalKeysExamined"] for s in stats),
+            "executionStages": {"stage": "SEQUENCE", "inputStages": [s["executionStages"] for s in stats]}
+        }}
+
+    def result_signature(self):
+        """Signatures of the collections after each update (computed on scratch copies, so the updates must be on
+        different collections)"""
+        return tuple(update.result_signature() for update in self.updates)
+
+def execution_stats(explain):
+
+    """Summary of an explain output: server execution time, documents and index keys examined and the plan.
+
+    Pipelines that are run completely by the query engine report a single executionStats; otherwise the explain
+    has a list of stages whose first one ($cursor) holds the executionStats of the query engine part"""
+
+    if "stages" in explain:
+        cursor_stats = explain["stages"][0]["$cursor"]["executionStats"]
+        later_stages = [name for stage in explain["stages"][1:] for name in stage if name.startswith("$")]
+        return {
+            # The time estimates of the stages are cumulative, so the last stage holds the time of the whole pipeline
+            "server_time_ms": explain["stages"][-1].get("executionTimeMillisEstimate", cursor_stats["executionTimeMillis"]),
+            "docs_examined": cursor_stats["totalDocsExamined"],
+            "keys_examined": cursor_stats["totalKeysExamined"],
+            "plan": " -> ".join([plan_tree(cursor_stats["executionStages"])] + later_stages)
+        }
+    stats = explain["executionStats"]
+    return {
+        "server_time_ms": stats["executionTimeMillis"],
+        "docs_examined": stats["totalDocsExamined"],
+        "keys_examined": stats["totalKeysExamined"],
+        "plan": plan_tree(stats["executionStages"])
+    }
+
+def plan_tree(stage):
+
+    """Stage tree of a plan as text, e.g. PROJECTION_SIMPLE(FETCH(IXSCAN dateOfBirth_1))"""
+
+    # Classic plans use inputStage/inputStages, slot-based (SBE) plans also outerStage/innerStage
+    children = [stage[key] for key in ("inputStage", "outerStage", "innerStage") if key in stage] + stage.get("inputStages", [])
+    name = stage["stage"] + (f" {stage['indexName']}" if "indexName" in stage else "")
+    return f"{name}({', '.join(plan_tree(child) for child in children)})" if children else name
+
+def query_variants(model, query):
+
+    """Names of the variants of a query of a model: the baseline followed by the ones in model.QUERY_VARIANTS"""
+
+    return [BASELINE] + list(model.QUERY_VARIANTS.get(query, {}))
+
+def query_spec(model, query, variant=BASELINE):
+
+    """Query object of a variant of a query of a model"""
+
+    if variant == BASELINE:
+        return getattr(model, f"query_{query}_spec")()
+    variants = model.QUERY_VARIANTS.get(query, {})
+    if variant not in variants:
+        raise ValueError(f"{type(model).__name__} has no variant '{variant}' of query {query} "
+                         f"(available: {', '.join(query_variants(model, query))})")
+    return getattr(model, variants[variant])()
+
+def same_results(baseline, variant):
+
+    """Check that a variant returns the same results as the baseline (reads) or leaves the same data (writes)"""
+
+    return baseline.result_signature() == variant.result_signature()